@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import ipaddress
+class TokenBucket(object):
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+    def __init__(self, rate, burst, now):
+        self.rate, self.burst = rate, burst
+        self.tokens = burst
+        self.updated = now
+    def take(self, now):
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+    def full(self, now): return self.tokens + (now - self.updated) * self.rate >= self.burst
+class Admission(object):
+    def __init__(self, clock, rate=2.0, burst=10, subnet_rate=20.0, subnet_burst=50, max_pending=256, exempt=()):
+        self.clock = clock
+        self.rate, self.burst = rate, burst
+        self.subnet_rate, self.subnet_burst = subnet_rate, subnet_burst
+        self.max_pending = max_pending
+        self.exempt = frozenset(exempt)
+        self.hosts = {}
+        self.subnets = {}
+        self.pending = 0
+    @staticmethod
+    def unmap(host):
+        # Dual-stack listeners report IPv4 peers as ::ffff:a.b.c.d
+        if ':' not in host: return host
+        try: mapped = ipaddress.ip_address(host).ipv4_mapped
+        except ValueError: return host
+        return host if mapped is None else str(mapped)
+    @staticmethod
+    def subnet(host):
+        if ':' not in host: return host.rpartition('.')[0]
+        try: return str(ipaddress.ip_network(host + '/64', strict=False))
+        except ValueError: return host
+    def admit(self, host):
+        # Returns the reason the connection is refused, or None after counting it as pending
+        if self.max_pending > 0 and self.pending >= self.max_pending: return 'pending'
+        host = self.unmap(host)
+        if host not in self.exempt:
+            now = self.clock.seconds()
+            if self.rate > 0:
+                bucket = self.hosts.get(host)
+                if bucket is None: bucket = self.hosts[host] = TokenBucket(self.rate, self.burst, now)
+                if not bucket.take(now): return 'ip'
+            if self.subnet_rate > 0:
+                subnet = self.subnet(host)
+                bucket = self.subnets.get(subnet)
+                if bucket is None: bucket = self.subnets[subnet] = TokenBucket(self.subnet_rate, self.subnet_burst, now)
+                if not bucket.take(now): return 'subnet'
+        self.pending += 1
+        return None
+    def release(self): self.pending -= 1
+    def prune(self):
+        now = self.clock.seconds()
+        for buckets in (self.hosts, self.subnets):
+            for key in [key for key, bucket in buckets.items() if bucket.full(now)]: del buckets[key]
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Bad connections per second the server absorbs while players stay responsive.
+# Players and flooders bind distinct 127.x.y.z source addresses so the per-IP and per-subnet buckets apply on loopback (Linux).
+# python benchmarks/admission.py [--players 20] [--rates 0,500,2000,5000] [--phase 5] [--kind idle|junk|churn]
+import argparse, asyncio, multiprocessing, os, sys, time
+from urllib.request import urlopen
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from swarm import Buffer, Connection, Process, percentiles, spawn
+def flood(port, rate, seconds, kind, sources, results):
+    async def attempt(source, stats):
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port, local_addr=(source, 0))
+        except OSError: return stats.__setitem__('failed', stats['failed'] + 1)
+        if kind == 'junk': writer.write(b'\xff' * 64)
+        elif kind == 'churn':
+            writer.close()
+            return stats.__setitem__('churned', stats['churned'] + 1)
+        try: await asyncio.wait_for(reader.read(), seconds + 10)
+        except (asyncio.TimeoutError, OSError): pass
+        closed = time.perf_counter() - start
+        stats['refused' if closed < 0.1 else 'closed'] += 1
+        writer.close()
+    async def run():
+        stats = dict(attempted=0, refused=0, closed=0, churned=0, failed=0)
+        tasks, start = [], time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            due = int((time.perf_counter() - start) * rate)
+            while stats['attempted'] < due:
+                tasks.append(asyncio.ensure_future(attempt(sources[stats['attempted'] % len(sources)], stats)))
+                stats['attempted'] += 1
+            await asyncio.sleep(0.005)
+        await asyncio.gather(*tasks)
+        results.put(stats)
+    asyncio.new_event_loop().run_until_complete(run())
+class Player(object):
+    def __init__(self, index, port):
+        self.index, self.port = index, port
+        self.samples = []
+    async def join(self, protocol_version):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port, local_addr=('127.0.1.%d' % (self.index + 1), 0))
+        self.conn = conn = Connection(protocol_version, reader, writer)
+        conn.send('handshake', Buffer.pack_varint(protocol_version) + Buffer.pack_string('localhost') + Buffer.pack('H', self.port) + Buffer.pack_varint(2))
+        conn.mode = 'login'
+        conn.send('login_start', Buffer.pack_string('player%d' % self.index))
+        while conn.mode == 'login':
+            name, packet = await conn.receive()
+            if name == 'login_set_compression': conn.threshold = packet.unpack_varint()
+            elif name == 'login_success': conn.mode = 'play'
+            elif name == 'login_disconnect': raise EOFError(packet.unpack_string())
+    async def run(self, stopping):
+        sent, serial = {}, 0
+        async def listen():
+            while True:
+                name, packet = await self.conn.receive()
+                if name == 'keep_alive': self.conn.send('keep_alive', packet.unpack_raw(packet.length()))
+                elif name == 'chat_message':
+                    text = packet.unpack_string()
+                    token = 'rtt%d.' % self.index
+                    if token in text:
+                        started = sent.pop(text.split(token, 1)[1].split('"', 1)[0], None)
+                        if started is not None: self.samples.append(time.perf_counter() - started)
+        listener = asyncio.ensure_future(listen())
+        while not stopping.is_set():
+            serial += 1
+            sent[str(serial)] = time.perf_counter()
+            self.conn.send('chat_message', Buffer.pack_string('rtt%d.%d' % (self.index, serial)))
+            await asyncio.sleep(0.2)
+        listener.cancel()
+def scrape(port, names):
+    values = dict((name, 0.0) for name in names)
+    for line in urlopen('http://127.0.0.1:%d/metrics' % port, timeout=5).read().decode().splitlines():
+        name = line.split('{', 1)[0].split(' ', 1)[0]
+        if name in values: values[name] += float(line.rsplit(' ', 1)[1])
+    return values
+async def main(args, process):
+    players = [Player(index, args.port) for index in range(args.players)]
+    await asyncio.gather(*[player.join(340 if index % 2 else 47) for index, player in enumerate(players)])
+    sources = ['127.2.%d.%d' % (i // 250, i % 250 + 1) for i in range(args.sources)]
+    loop = asyncio.get_event_loop()
+    counters = ('connections_rejected_total', 'connections_timed_out_total')
+    for rate in args.rates:
+        for player in players: player.samples = []
+        stopping = asyncio.Event()
+        running = [asyncio.ensure_future(player.run(stopping)) for player in players]
+        before, cpu = scrape(args.metrics_port, counters), process.sample()[1]
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=flood, args=(args.port, rate / float(args.flooders), args.phase, args.kind, sources[i::args.flooders], results)) for i in range(args.flooders)] if rate else []
+        for worker in workers: worker.start()
+        started = time.perf_counter()
+        await asyncio.sleep(args.phase)
+        used = process.sample()[1] - cpu if cpu is not None else None
+        elapsed = time.perf_counter() - started
+        stopping.set()
+        await asyncio.gather(*running)
+        stats = dict(attempted=0, refused=0, closed=0, churned=0, failed=0)
+        for worker in workers:
+            for key, value in (await loop.run_in_executor(None, results.get)).items(): stats[key] += value
+        for worker in workers: worker.join()
+        after = scrape(args.metrics_port, counters)
+        print('flood %5d/s %-5s | %6d attempted %6d refused by server %5d timed out  | server CPU %5.1f%% | player chat rtt %s' % (
+            rate, args.kind if rate else '', stats['attempted'], after[counters[0]] - before[counters[0]], after[counters[1]] - before[counters[1]],
+            used * 100 / elapsed if used is not None else 0, percentiles(sum((player.samples for player in players), []))))
+    for player in players: player.conn.close()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=20)
+    parser.add_argument('--rates', default='0,500,2000,5000', help='flood connection attempts per second, one phase each')
+    parser.add_argument('--phase', type=float, default=5)
+    parser.add_argument('--kind', default='idle', choices=('idle', 'junk', 'churn'), help='idle holds the socket open, junk sends garbage, churn closes at once')
+    parser.add_argument('--sources', type=int, default=1000, help='distinct flood source addresses')
+    parser.add_argument('--flooders', type=int, default=2, help='flood processes')
+    parser.add_argument('--port', type=int, default=25591)
+    parser.add_argument('--metrics-port', type=int, default=25592)
+    args = parser.parse_args()
+    args.rates = [int(rate) for rate in args.rates.split(',')]
+    server = spawn(args.port, {'max-players': args.players + 10, 'rate-limit-exempt': '', 'metrics-port': args.metrics_port, 'handshake-timeout': 2, 'log-file': os.devnull})
+    try: asyncio.get_event_loop().run_until_complete(main(args, Process(server.pid)))
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,30 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Chat broadcast cost: one send_packet per player against AuthServer.broadcast.
+# python benchmarks/broadcast.py [players]
+import os, sys, time
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+from main import AuthServer, AuthProtocol, Buffer
+from fakes import Address, Transport
+def make_server(count, versions=(47, 107, 210, 340)):
+    server = AuthServer()
+    for i in range(count):
+        player = AuthProtocol(server, Address())
+        player.protocol_version, player.protocol_mode = versions[i % len(versions)], 3
+        player.transport = Transport()
+        server.players.add(player)
+    return server
+def per_player(server, name, data):
+    for player in server.players: player.send_packet(name, data)
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server = make_server(count)
+    for text in ('short line', 'long line ' * 40):
+        data = Buffer.pack_chat(text) + Buffer.pack('b', 0)
+        for label, fn in (('per player', per_player), ('broadcast', AuthServer.broadcast)):
+            start = time.perf_counter()
+            for i in range(20): fn(server, 'chat_message', data)
+            took = (time.perf_counter() - start) / 20
+            print('%4d players %4d byte chat | %-10s %8.3f ms/broadcast %8.2f us/player' % (count, len(data), label, took * 1000, took * 1e6 / count))
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# ops/sec of the Buffer field codecs against the per-call struct format versions they replaced.
+# python benchmarks/buffer_codecs.py
+import os, sys, struct, timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import Buffer
+def old_pack(ty, *data): return struct.pack('>'+ty, *data)
+def old_pack_varint(d):
+    o = b''
+    while True:
+        b = d & 0x7F
+        d >>= 7
+        o += struct.pack('B', b | (0x80 if d > 0 else 0))
+        if d == 0: break
+    return o
+class OldBuffer(Buffer):
+    def unpack(self, ty):
+        s = struct.unpack('>'+ty, self.unpack_raw(struct.calcsize(ty)))
+        return s[0] if len(ty) == 1 else s
+    def unpack_varint(self):
+        d = 0
+        for i in range(5):
+            b = self.unpack('B')
+            d |= (b & 0x7F) << 7*i
+            if not b & 0x80: break
+        return d
+def reader(cls, data, method, *args):
+    buff = cls(data)
+    fn = getattr(buff, method)
+    def read():
+        buff.pos = 0
+        return fn(*args)
+    return read
+position = Buffer.pack('ddd?', 1.0, 64.0, 1.0, True)
+varints = {v: Buffer.pack_varint(v) for v in (42, 300, 2**21)}
+out = bytearray(64)
+cases = [
+    ('pack ddd?', lambda: old_pack('ddd?', 1.0, 64.0, 1.0, True), lambda: Buffer.pack('ddd?', 1.0, 64.0, 1.0, True)),
+    ('pack_into ddd?', None, lambda: Buffer.pack_into('ddd?', out, 0, 1.0, 64.0, 1.0, True)),
+    ('unpack ddd?', reader(OldBuffer, position, 'unpack', 'ddd?'), reader(Buffer, position, 'unpack', 'ddd?')),
+    ('unpack_from ddd?', None, lambda: Buffer.unpack_from('ddd?', position)),
+]
+for v, data in varints.items():
+    cases.append(('pack_varint %d' % v, lambda v=v: old_pack_varint(v), lambda v=v: Buffer.pack_varint(v)))
+    cases.append(('unpack_varint %d' % v, reader(OldBuffer, data, 'unpack_varint'), reader(Buffer, data, 'unpack_varint')))
+def ops(fn, number=200000): return number / min(timeit.repeat(fn, number=number, repeat=3))
+if __name__ == '__main__':
+    print('%-22s %14s %14s %8s' % ('case', 'before ops/s', 'after ops/s', 'speedup'))
+    for name, before, after in cases:
+        b, a = (ops(before) if before else None), ops(after)
+        print('%-22s %14s %14.0f %8s' % (name, '%.0f' % b if b else '-', a, '%.2fx' % (a / b) if b else '-'))
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Decodes one large pipelined stream the way AuthProtocol.dataReceived does.
+# python benchmarks/buffer_stream.py [packets]
+import os, sys, struct, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import Buffer, BufferUnderrun
+class BytesBuffer(Buffer):
+    def __init__(self, data=b''):
+        self.buff1 = bytes(data)
+        self.buff2 = b''
+    def length(self): return len(self.buff1)
+    def add(self, data): self.buff1 += data
+    def save(self): self.buff2 = self.buff1
+    def restore(self): self.buff1 = self.buff2
+    def unpack_raw(self, l):
+        if len(self.buff1) < l: raise BufferUnderrun()
+        d, self.buff1 = self.buff1[:l], self.buff1[l:]
+        return d
+    def unpack(self, ty):
+        s = struct.unpack('>'+ty, self.unpack_raw(struct.calcsize(ty)))
+        return s[0] if len(ty) == 1 else s
+    def unpack_varint(self):
+        d = 0
+        for i in range(5):
+            b = self.unpack('B')
+            d |= (b & 0x7F) << 7*i
+            if not b & 0x80: break
+        return d
+def make_stream(count):
+    body = Buffer.pack_varint(0x0E) + Buffer.pack('ddd?', 1.0, 64.0, 1.0, True)
+    return (Buffer.pack_varint(len(body)) + body) * count
+def decode(buff, stream):
+    buff.add(stream)
+    n = 0
+    while True:
+        try:
+            buff.unpack_raw(buff.unpack_varint())
+            buff.save()
+            n += 1
+        except BufferUnderrun:
+            buff.restore()
+            return n
+def run(cls, stream, count):
+    start = time.perf_counter()
+    assert decode(cls(), stream) == count
+    return time.perf_counter() - start
+if __name__ == '__main__':
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    count = 2500
+    while count <= top:
+        stream = make_stream(count)
+        new, old = run(Buffer, stream, count), run(BytesBuffer, stream, count)
+        print('%7d packets %8d bytes | bytearray %8.1f ms %10.0f pkt/s | bytes %8.1f ms %10.0f pkt/s' % (count, len(stream), new * 1000, count / new, old * 1000, count / old))
+        count *= 2
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Encoding and serving a 10x10 view of a lobby world loaded from a memory-mapped region file.
+# python benchmarks/chunks.py
+import os, sys, shutil, tempfile, timeit
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+import numpy as np
+import chunks
+from main import AuthServer, AuthProtocol
+from fakes import Address, Transport
+def lobby_chunk(chunk_x, chunk_z, rng):
+    sections = {}
+    floor = np.zeros((16, 16, 16), dtype=np.uint16)
+    floor[0], floor[1:4] = 7 << 4, 1 << 4
+    floor[4] = (35 << 4) | rng.integers(0, 16, (16, 16))
+    sections[3] = chunks.Section(floor)
+    decor = np.zeros(4096, dtype=np.uint16)
+    decor[:1024] = (rng.integers(1, 160, 1024) << 4) | rng.integers(0, 16, 1024)
+    sections[4] = chunks.Section(decor)
+    if (chunk_x + chunk_z) % 3 == 0: sections[5] = chunks.Section((rng.integers(1, 256, 4096) << 4) | rng.integers(0, 16, 4096))
+    return chunks.Chunk(chunk_x, chunk_z, sections)
+def loop_pack_longs(values, bits):
+    longs = [0] * (len(values) * bits // 64)
+    for i, value in enumerate(values.tolist()):
+        offset = i * bits
+        index, shift = offset // 64, offset % 64
+        longs[index] |= (value << shift) & 0xFFFFFFFFFFFFFFFF
+        if shift + bits > 64: longs[index + 1] |= value >> (64 - shift)
+    return longs
+def ms(fn, number=5): return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1000
+if __name__ == '__main__':
+    folder = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(folder, 'region'))
+        rng = np.random.default_rng(1)
+        view = [(x, z) for x in range(-5, 5) for z in range(-5, 5)]
+        lobby = [lobby_chunk(x, z, rng) for x, z in view]
+        for region_x in (-1, 0):
+            for region_z in (-1, 0):
+                chunks.RegionFile.save(os.path.join(folder, 'region', 'r.%d.%d.mca' % (region_x, region_z)), [c for c in lobby if (c.x >> 5, c.z >> 5) == (region_x, region_z)])
+        server = AuthServer()
+        server.world.close()
+        server.world = chunks.World(folder)
+        sections = [section for chunk in lobby for section in chunk.sections.values()]
+        print('%-44s %9.2f ms' % ('load 10x10 view from region (mmap + NBT)', ms(lambda: [server.world.get_chunk(x, z) for x, z in view])))
+        def pack_all(pack):
+            for section in sections:
+                bits, palette, indices = section.palette()
+                pack(indices, bits)
+        print('%-44s %9.2f ms' % ('palette + pack %d sections, Python loop' % len(sections), ms(lambda: pack_all(loop_pack_longs), 1)))
+        print('%-44s %9.2f ms' % ('palette + pack %d sections, NumPy' % len(sections), ms(lambda: pack_all(chunks.pack_longs))))
+        for protocol_version in (4, 47, 340):
+            player = AuthProtocol(server, Address())
+            player.protocol_version, player.protocol_mode, player.compression = protocol_version, 3, server.compression
+            player.transport = Transport()
+            def cold():
+                server.chunk_packets.clear()
+                for x, z in view: player.send_chunk(x, z)
+            def warm():
+                for x, z in view: player.send_chunk(x, z)
+            print('protocol %3d %-32s %9.2f ms' % (protocol_version, 'serve 10x10 view, cold cache', ms(cold)))
+            warm()
+            player.transport.bytes = 0
+            print('protocol %3d %-32s %9.2f ms  %7d bytes' % (protocol_version, 'serve 10x10 view, cached', ms(warm, 50), player.transport.bytes // 150))
+        server.world.close()
+        server.log_writer.close()
+        server.plugin_system.close()
+    finally: shutil.rmtree(folder)
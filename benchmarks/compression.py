@@ -0,0 +1,35 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Bytes on the wire and CPU per packet for a mixed packet stream across compression thresholds and levels.
+# python benchmarks/compression.py
+import os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import Buffer, Compression
+def make_stream(count=5000, seed=1):
+    rng = random.Random(seed)
+    chunk = bytes(rng.choice(b'\x00\x00\x00\x01\x02') for i in range(8192))
+    samples = [
+        (40, Buffer.pack_varint(0x1F) + Buffer.pack_varint(12345)),
+        (30, Buffer.pack_varint(0x2F) + Buffer.pack('dddff?', 1.5, 64.0, -3.25, 90.0, 0.0, True)),
+        (20, Buffer.pack_varint(0x0F) + Buffer.pack_chat('<player> hello there, how is everyone doing today?') + b'\x00'),
+        (5, Buffer.pack_varint(0x0F) + Buffer.pack_chat('announcement ' * 30) + b'\x00'),
+        (3, Buffer.pack_varint(0x18) + Buffer.pack_string('BungeeCord') + bytes(rng.getrandbits(8) for i in range(600))),
+        (2, Buffer.pack_varint(0x20) + Buffer.pack('ii?', 0, 0, True) + Buffer.pack_varint(0xFFFF) + Buffer.pack_varint(len(chunk)) + chunk),
+    ]
+    population = [body for weight, body in samples for i in range(weight)]
+    return [rng.choice(population) for i in range(count)]
+def run(stream, compression):
+    start = time.process_time()
+    if compression is None: size = sum(len(Buffer.pack_varint(len(body))) + len(body) for body in stream)
+    else: size = sum(len(compression.frame(body)) for body in stream)
+    return size, time.process_time() - start
+if __name__ == '__main__':
+    stream = make_stream()
+    raw, cpu = run(stream, None)
+    print('%-34s %10s %7s %12s' % ('setting', 'bytes', 'ratio', 'us/packet'))
+    print('%-34s %10d %6.1f%% %12.2f' % ('uncompressed', raw, 100.0, cpu * 1e6 / len(stream)))
+    for level in (1, 6, 9):
+        for threshold in (0, 64, 128, 256, 512, 1024, 4096):
+            for skip in (False, True):
+                size, cpu = run(stream, Compression(threshold, level, skip))
+                print('%-34s %10d %6.1f%% %12.2f' % ('level %d threshold %4d%s' % (level, threshold, ' skip' if skip else ''), size, size * 100.0 / raw, cpu * 1e6 / len(stream)))
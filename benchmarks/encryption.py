@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# AES/CFB8 throughput and the per-packet cost of an encrypted connection against a plaintext one, after a real encrypted login.
+# python benchmarks/encryption.py [packets per flush]
+import os, sys, time, timeit
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+import packets
+from main import AuthServer, Buffer
+from encryption import Encryption
+from fakes import Address, Capture, Discard, frame
+def array(protocol_version, data): return Buffer.pack_array(data) if protocol_version < 47 else Buffer.pack_varint(len(data)) + data
+def login(server, protocol_version, name, encrypted):
+    player = server.buildProtocol(Address())
+    player.makeConnection(Capture())
+    handshake = Buffer.pack_varint(protocol_version) + Buffer.pack_string('localhost') + Buffer.pack('H', 25565) + Buffer.pack_varint(2)
+    server.encryption = server_encryption if encrypted else None
+    player.dataReceived(frame(0, handshake) + frame(0, Buffer.pack_string(name)))
+    server.flush_corked()
+    if not encrypted: return player, None
+    buff = Buffer(bytes(player.transport.data))
+    del player.transport.data[:]
+    buff.unpack_varint()
+    assert buff.unpack_varint() == packets.get_table(protocol_version).idents['login', 'downstream', 'login_encryption_request']
+    buff.unpack_string()
+    if protocol_version < 47: key, token = buff.unpack_array(), buff.unpack_array()
+    else: key, token = buff.unpack_raw(buff.unpack_varint()), buff.unpack_raw(buff.unpack_varint())
+    public_key, secret = serialization.load_der_public_key(key), os.urandom(16)
+    response = array(protocol_version, public_key.encrypt(secret, padding.PKCS1v15())) + array(protocol_version, public_key.encrypt(token, padding.PKCS1v15()))
+    player.dataReceived(frame(packets.get_table(protocol_version).idents['login', 'upstream', 'login_encryption_response'], response))
+    server.flush_corked()
+    encryptor, decryptor = Encryption.ciphers(secret)
+    buff = Buffer(decryptor.update(bytes(player.transport.data)))
+    buff.unpack_varint()
+    first = 'login_success' if player.compression is None else 'login_set_compression'
+    assert buff.unpack_varint() == packets.get_table(protocol_version).idents['login', 'downstream', first], 'login burst did not decrypt'
+    assert player.get_mode() == 'play'
+    return player, encryptor
+def cipher_rates(size, total=1 << 22):
+    data = os.urandom(size)
+    count = max(1, total // size)
+    encryptor = Encryption.ciphers(os.urandom(16))[0]
+    persistent = min(timeit.repeat(lambda: encryptor.update(data), number=count, repeat=3))
+    secret = os.urandom(16)
+    fresh = min(timeit.repeat(lambda: Encryption.ciphers(secret)[0].update(data), number=min(count, 20000), repeat=3)) * count / min(count, 20000)
+    return size * count / persistent / 1e6, size * count / fresh / 1e6
+def outbound(server, player, per_flush, turns=2000):
+    player.transport = Discard()
+    start = time.perf_counter()
+    for turn in range(turns):
+        player.cork()
+        for i in range(per_flush): player.send_chat('<bot> message number %d in this turn' % i)
+        player.flush()
+    return (time.perf_counter() - start) * 1e6 / (turns * per_flush)
+def inbound(player, encryptor, per_flush, turns=2000):
+    body = player.keep_alive_payload(7)
+    ident = packets.get_table(player.protocol_version).idents['play', 'upstream', 'keep_alive']
+    packet = Buffer.pack_varint(ident) + body
+    packet = player.compression.frame(packet) if player.compression is not None else Buffer.pack_varint(len(packet)) + packet
+    chunks = [packet * per_flush] * turns
+    if encryptor is not None: chunks = [encryptor.update(chunk) for chunk in chunks]
+    start = time.perf_counter()
+    for chunk in chunks: player.dataReceived(chunk)
+    player.flush()
+    return (time.perf_counter() - start) * 1e6 / (turns * per_flush)
+if __name__ == '__main__':
+    per_flush = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    start = time.perf_counter()
+    server_encryption = Encryption()
+    print('RSA-1024 keypair generated once in %.1f ms' % ((time.perf_counter() - start) * 1000))
+    server = AuthServer()
+    server.log_writer.echo = False
+    server.max_players = 100
+    for protocol_version in (4, 47, 340):
+        start = time.perf_counter()
+        login(server, protocol_version, 'check%d' % protocol_version, True)
+        print('encrypted login protocol %3d ok in %.2f ms' % (protocol_version, (time.perf_counter() - start) * 1000))
+    print('%-10s %18s %18s' % ('bytes', 'MB/s persistent', 'MB/s new context'))
+    for size in (16, 64, 256, 1024, 16384, 262144):
+        persistent, fresh = cipher_rates(size)
+        print('%-10d %18.1f %18.1f' % (size, persistent, fresh))
+    plain, plain_cipher = login(server, 340, 'plain', False)
+    secure, secure_cipher = login(server, 340, 'secure', True)
+    for label, fn in (('outbound chat', lambda player, cipher: outbound(server, player, per_flush)), ('inbound keep-alive', lambda player, cipher: inbound(player, cipher, per_flush))):
+        a, b = min(fn(plain, plain_cipher) for i in range(3)), min(fn(secure, secure_cipher) for i in range(3))
+        print('%-19s %3d packets/flush | plaintext %6.2f us/packet  encrypted %6.2f us/packet  overhead %5.2f us/packet (%4.1f%%)' % (label, per_flush, a, b, b - a, (b - a) * 100 / a))
+    server.log_writer.close()
+    server.plugin_system.close()
@@ -0,0 +1,26 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Stand-ins for the Twisted address and transport and a raw packet framer, shared by the benchmarks (import after main is on sys.path).
+from main import Buffer
+class Address(object):
+    host = '127.0.0.1'
+class Transport(object):
+    def __init__(self): self.writes, self.bytes = 0, 0
+    def write(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+    def loseConnection(self): pass
+class Capture(Transport):
+    def __init__(self):
+        Transport.__init__(self)
+        self.data = bytearray()
+    def write(self, data):
+        Transport.write(self, data)
+        self.data += data
+class Discard(object):
+    __slots__ = ()
+    def write(self, data): pass
+    def loseConnection(self): pass
+def frame(ident, data):
+    body = Buffer.pack_varint(ident) + data
+    return Buffer.pack_varint(len(body)) + body
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Bytes the server holds per open connection, measured with tracemalloc: idle sockets and status (server list ping) connections.
+# python benchmarks/footprint.py [connections]
+import gc, os, sys, tracemalloc
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+from main import AuthServer, Buffer
+from fakes import Address, Discard, frame
+def ping_request(protocol_version):
+    handshake = Buffer.pack_varint(protocol_version) + Buffer.pack_string('localhost') + Buffer.pack('H', 25565) + Buffer.pack_varint(1)
+    return frame(0, handshake) + frame(0, b'')
+def connect(server, data):
+    player = server.buildProtocol(Address())
+    player.makeConnection(Discard())
+    if data: player.dataReceived(data)
+    return player
+def measure(server, count, data):
+    connect(server, data)
+    server.flush_corked()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    players = [connect(server, data) for i in range(count)]
+    server.flush_corked()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    for player in players: player.connectionLost()
+    return size / float(count)
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    server = AuthServer()
+    server.admission.max_pending = 0
+    print('%d connections' % count)
+    print('idle connection      %7.0f bytes' % measure(server, count, b''))
+    for protocol_version in (47, 340): print('ping connection %3d  %7.0f bytes' % (protocol_version, measure(server, count, ping_request(protocol_version))))
+    server.log_writer.close()
+    server.plugin_system.close()
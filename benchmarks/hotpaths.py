@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# ops/sec of the per-packet hot paths: Buffer codecs and framing, packets lookups and PluginSystem.call_event.
+# python benchmarks/hotpaths.py [--save baseline.json] [--compare baseline.json] [--tolerance 0.25]
+import argparse, json, os, sys, timeit
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+import packets
+from main import Buffer, BufferUnderrun
+from plugin_core import PluginSystem
+def reader(data, method, *args):
+    buff = Buffer(data)
+    fn = getattr(buff, method)
+    def read():
+        buff.pos = 0
+        return fn(*args)
+    return read
+def frames(stream):
+    buff = Buffer()
+    def parse():
+        buff.add(stream)
+        while True:
+            try:
+                buff.unpack_raw(buff.unpack_varint())
+                buff.save()
+            except BufferUnderrun:
+                buff.restore()
+                break
+    return parse
+def cases():
+    position = Buffer.pack('ddd?', 1.0, 64.0, 1.0, True)
+    chat = Buffer.pack_string('hello world')
+    frame = Buffer.pack_varint(len(position) + 1) + b'\x04' + position
+    table = packets.get_table(340)
+    system = PluginSystem()
+    system.log = lambda message: None
+    system.add_event('player_move', lambda player, x, y, z, on_ground: None)
+    return [
+        ('buffer pack_varint 300', lambda: Buffer.pack_varint(300)),
+        ('buffer unpack_varint 300', reader(Buffer.pack_varint(300), 'unpack_varint')),
+        ('buffer pack ddd?', lambda: Buffer.pack('ddd?', 1.0, 64.0, 1.0, True)),
+        ('buffer unpack ddd?', reader(position, 'unpack', 'ddd?')),
+        ('buffer pack_string', lambda: Buffer.pack_string('hello world')),
+        ('buffer unpack_string', reader(chat, 'unpack_string')),
+        ('buffer pack_chat', lambda: Buffer.pack_chat('hello world')),
+        ('buffer 64 frames per add', frames(frame * 64)),
+        ('packets ident', lambda: table.idents['play', 'downstream', 'chat_message']),
+        ('packets name', lambda: table.names['play', 'upstream'][0x0D]),
+        ('packets get_table', lambda: packets.get_table(340)),
+        ('packets legacy packet_idents', lambda: packets.packet_idents[340, 'play', 'downstream', 'chat_message']),
+        ('call_event with handler', lambda: system.call_event('player_move', None, 1.0, 64.0, 1.0, True)),
+        ('call_event without handler', lambda: system.call_event('packet_recived', None, 0, 'keep_alive')),
+    ]
+def measure(fn, number=100000): return number / min(timeit.repeat(fn, number=number, repeat=5))
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--save')
+    parser.add_argument('--compare')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+    results, regressions = {}, []
+    for name, fn in cases():
+        results[name] = measure(fn)
+        line = '%-32s %12.0f ops/s' % (name, results[name])
+        if name in baseline:
+            change = results[name] / baseline[name] - 1
+            line += '  %+6.1f%%' % (change * 100)
+            if change < -args.tolerance:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+    if args.save:
+        with open(args.save, 'w') as f: json.dump(results, f, indent=1, sort_keys=True)
+    if regressions:
+        print('%d hot paths slower than baseline by more than %d%%: %s' % (len(regressions), args.tolerance * 100, ', '.join(regressions)))
+        sys.exit(1)
@@ -0,0 +1,58 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Fresh-interpreter import time of packets and main with a cold cache, a warm cache and the old CSV loader.
+# python benchmarks/import_time.py [runs]
+import os, subprocess, sys
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+import packets
+legacy = '''
+import csv, os.path
+def _load():
+    default_protocol_version = 0
+    minecraft_versions = {}
+    packet_names = {}
+    packet_idents = {}
+    packet_ident = 0
+    last_section = None
+    with open(%r) as csvfile:
+        reader = csv.reader(csvfile)
+        for i, record in enumerate(reader):
+            if i == 0: continue
+            minecraft_version = record[0]
+            protocol_version = int(record[1])
+            protocol_mode = record[2]
+            packet_direction = record[3]
+            packet_name = record[4]
+            section = (protocol_version, protocol_mode, packet_direction)
+            if section != last_section: packet_ident = 0
+            last_section = section
+            default_protocol_version = max(default_protocol_version, protocol_version)
+            minecraft_versions[protocol_version] = minecraft_version
+            key = [protocol_version, protocol_mode, packet_direction]
+            packet_names [tuple(key + [packet_ident])] = packet_name
+            packet_idents[tuple(key + [packet_name ])] = packet_ident
+            packet_ident += 1
+    return default_protocol_version, minecraft_versions, packet_names, packet_idents
+_load()
+''' % packets.csvpath
+def measure(code, runs):
+    probe = 'import time; t = time.perf_counter()\n%s\nprint(time.perf_counter() - t)' % code
+    times = []
+    for i in range(runs):
+        if code.startswith('#cold'):
+            try: os.remove(packets.cachepath)
+            except OSError: pass
+        times.append(float(subprocess.check_output([sys.executable, '-c', probe], cwd=root).split()[-1]))
+    times.sort()
+    return times[len(times) // 2] * 1000
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    cases = [
+        ('csv loader (before)', 'exec(%r)' % legacy),
+        ('import packets, cold cache', '#cold\nimport packets'),
+        ('import packets, warm cache', 'import packets'),
+        ('import packets + first version', 'import packets; packets.get_table(340)'),
+        ('import main, warm cache', 'import main'),
+    ]
+    for name, code in cases: print('%-32s %8.2f ms (median of %d)' % (name, measure(code, runs), runs))
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Movement fan-out per tick for thousands of moving players: interest grid against scanning every player.
+# python benchmarks/interest.py [players] [area] [ticks]
+import math, os, random, sys, time
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+import uuid
+from main import AuthServer, AuthProtocol
+from fakes import Address, Transport
+def make_players(server, count, area, rng):
+    players = []
+    for i in range(count):
+        player = AuthProtocol(server, Address())
+        player.protocol_version, player.protocol_mode = (47, 340)[i % 2], 3
+        player.transport = Transport()
+        player.username, player.uuid, player.entity_id = 'bot%d' % i, uuid.UUID(int=i + 1), i + 1
+        player.x, player.y, player.z = rng.uniform(0, area), 64.0, rng.uniform(0, area)
+        players.append(player)
+    return players
+def walk(players, rng):
+    for player in players:
+        player.x += rng.uniform(-0.3, 0.3)
+        player.z += rng.uniform(-0.3, 0.3)
+def scan_tick(players, radius):
+    # What a plugin has to do without an index: check every pair, encode per viewer
+    for player in players:
+        for viewer in players:
+            if viewer is not player and abs(viewer.x - player.x) <= radius and abs(viewer.z - player.z) <= radius:
+                viewer.write(viewer.encode_entity_move(player, ((0, 0, 0), (0, 0, 0)), ((1, 0, 0), (1, 0, 0))))
+def totals(players): return sum(p.transport.writes for p in players), sum(p.transport.bytes for p in players)
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    area = float(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    rng = random.Random(1)
+    server = AuthServer()
+    players = make_players(server, count, area, rng)
+    start = time.perf_counter()
+    for player in players: server.interest.add(player)
+    server.interest.tick()
+    server.flush_corked()
+    print('%d players on %dx%d blocks, view radius %d chunks' % (count, area, area, server.interest.radius))
+    print('initial spawn tick      %9.2f ms  %7d spawns' % ((time.perf_counter() - start) * 1000, server.interest.spawns))
+    elapsed, before = 0.0, totals(players)
+    for i in range(ticks):
+        walk(players, rng)
+        for player in players: server.interest.moved_player(player)
+        start = time.perf_counter()
+        server.interest.tick()
+        server.flush_corked()
+        elapsed += time.perf_counter() - start
+    writes, size = [b - a for a, b in zip(before, totals(players))]
+    print('grid tick               %9.2f ms  %7d moves/tick  %5.2f writes/player/tick  %7.0f bytes/write' % (elapsed * 1000 / ticks, server.interest.moves / ticks, writes / float(ticks * count), size / float(writes or 1)))
+    radius = (server.interest.radius + 0.5) * 16
+    scan_ticks = max(1, min(ticks, int(2e7 // (count * count)) or 1))
+    start, before = time.perf_counter(), totals(players)
+    for i in range(scan_ticks):
+        walk(players, rng)
+        scan_tick(players, radius)
+    elapsed = time.perf_counter() - start
+    writes, size = [b - a for a, b in zip(before, totals(players))]
+    print('scan all players tick   %9.2f ms  %7d moves/tick  %5.2f writes/player/tick' % (elapsed * 1000 / scan_ticks, writes / scan_ticks, writes / float(scan_ticks * count)))
+    server.log_writer.close()
+    server.plugin_system.close()
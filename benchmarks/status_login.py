@@ -0,0 +1,27 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Cost of answering a status request and of the static login burst, cached against re-encoded.
+# python benchmarks/status_login.py
+import os, sys, timeit
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+from main import AuthServer, AuthProtocol, Buffer
+from fakes import Address, Discard
+def make_player(server, protocol_version, mode):
+    player = AuthProtocol(server, Address())
+    player.protocol_version, player.protocol_mode = protocol_version, mode
+    player.transport = Discard()
+    return player
+def ops(fn, number=20000): return number / min(timeit.repeat(fn, number=number, repeat=3))
+if __name__ == '__main__':
+    server = AuthServer()
+    for protocol_version in (47, 340):
+        status, play = make_player(server, protocol_version, 1), make_player(server, protocol_version, 3)
+        cases = (
+            ('status encoded', lambda: status.send_packet('status_response', Buffer.pack_json(server.get_status(protocol_version)))),
+            ('status cached', lambda: status.handle_status_request(None)),
+            ('login burst encoded', lambda: play.transport.write(play.encode_login_packets())),
+            ('login burst cached', lambda: play.transport.write(server.get_login_packets(play))),
+        )
+        for name, fn in cases: print('protocol %3d %-20s %10.0f ops/s' % (protocol_version, name, ops(fn)))
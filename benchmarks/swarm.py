@@ -0,0 +1,215 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Loopback load test: N asyncio bots ping, log in, chat and move against a local server.
+# Reports join latency percentiles, pings/sec, chat fan-out latency, and server RSS and CPU per connection.
+# python benchmarks/swarm.py [--bots 100] [--versions 47,340] [--duration 10] [--no-spawn --port 25565 --pid PID]
+import argparse, asyncio, atexit, itertools, json, os, shutil, socket, subprocess, sys, tempfile, time, zlib
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+import packets
+from main import Buffer, BufferUnderrun
+class Connection(object):
+    def __init__(self, protocol_version, reader, writer):
+        self.table = packets.get_table(protocol_version)
+        self.reader, self.writer = reader, writer
+        self.buff = Buffer()
+        self.mode = 'init'
+        self.threshold = -1
+    def send(self, name, data):
+        body = Buffer.pack_varint(self.table.ident(self.mode, 'upstream', name)) + data
+        if self.threshold >= 0:
+            if len(body) >= self.threshold: body = Buffer.pack_varint(len(body)) + zlib.compress(body)
+            else: body = b'\x00' + body
+        self.writer.write(Buffer.pack_varint(len(body)) + body)
+    async def receive(self):
+        while True:
+            try:
+                body = self.buff.unpack_raw(self.buff.unpack_varint())
+                self.buff.save()
+                break
+            except BufferUnderrun:
+                self.buff.restore()
+                data = await self.reader.read(65536)
+                if not data: raise EOFError('Connection closed by server')
+                self.buff.add(data)
+        if self.threshold >= 0:
+            packet = Buffer(body)
+            size = packet.unpack_varint()
+            body = body[packet.pos:] if size == 0 else zlib.decompress(body[packet.pos:])
+        packet = Buffer(body)
+        return self.table.name(self.mode, 'downstream', packet.unpack_varint()), packet
+    def close(self): self.writer.close()
+class Swarm(object):
+    def __init__(self, args):
+        self.args = args
+        self.versions = [int(version) for version in args.versions.split(',')]
+        self.pings, self.joins, self.fanout, self.errors = [], [], [], []
+        self.sent = {}
+        self.moves = self.chats = 0
+        self.joined = 0
+        self.playing = asyncio.Event()
+        self.stopping = asyncio.Event()
+    async def connect(self, protocol_version, next_mode):
+        reader, writer = await asyncio.open_connection(self.args.host, self.args.port)
+        writer.transport.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = Connection(protocol_version, reader, writer)
+        conn.send('handshake', Buffer.pack_varint(protocol_version) + Buffer.pack_string(self.args.host) + Buffer.pack('H', self.args.port) + Buffer.pack_varint(next_mode))
+        conn.mode = 'status' if next_mode == 1 else 'login'
+        return conn
+    async def ping(self, protocol_version):
+        conn = await self.connect(protocol_version, 1)
+        try:
+            start = time.perf_counter()
+            conn.send('status_request', b'')
+            await conn.receive()
+            conn.send('status_ping', Buffer.pack('Q', 42))
+            await conn.receive()
+            self.pings.append(time.perf_counter() - start)
+        finally: conn.close()
+    async def pinger(self, index):
+        protocol_version = self.versions[index % len(self.versions)]
+        for i in range(self.args.pings):
+            try: await self.ping(protocol_version)
+            except (OSError, EOFError) as e: self.errors.append('ping: %s' % e)
+    async def bot(self, index):
+        protocol_version = self.versions[index % len(self.versions)]
+        name = 'bot%d' % index
+        start = time.perf_counter()
+        try: conn = await self.connect(protocol_version, 2)
+        except OSError as e: return self.errors.append('connect: %s' % e)
+        try:
+            conn.send('login_start', Buffer.pack_string(name))
+            while conn.mode == 'login':
+                packet_name, packet = await conn.receive()
+                if packet_name == 'login_set_compression': conn.threshold = packet.unpack_varint()
+                elif packet_name == 'login_success': conn.mode = 'play'
+                elif packet_name == 'login_disconnect': raise EOFError('Login refused: %s' % packet.unpack_string())
+            while True:
+                packet_name, packet = await conn.receive()
+                if packet_name == 'player_position_and_look': break
+            self.joins.append(time.perf_counter() - start)
+            self.joined += 1
+            if self.joined == self.args.bots: self.playing.set()
+            await asyncio.gather(self.listen(conn, name), self.act(conn, index))
+        except (OSError, EOFError, KeyError) as e:
+            if not self.stopping.is_set(): self.errors.append('%s: %s' % (name, e))
+            self.joined += 1
+            if self.joined == self.args.bots: self.playing.set()
+        finally: conn.close()
+    async def listen(self, conn, name):
+        while not self.stopping.is_set():
+            packet_name, packet = await conn.receive()
+            if packet_name == 'keep_alive': conn.send('keep_alive', packet.unpack_raw(packet.length()))
+            elif packet_name == 'chat_message':
+                text = json.loads(packet.unpack_string()).get('text', '')
+                if ' swarm ' in text:
+                    sent = self.sent.get(text.rsplit(' swarm ', 1)[1])
+                    if sent is not None: self.fanout.append(time.perf_counter() - sent)
+            elif packet_name == 'disconnect': raise EOFError('Kicked: %s' % packet.unpack_string())
+    async def act(self, conn, index):
+        await self.playing.wait()
+        x, z = float(index % 32), float(index // 32)
+        move_every = 1.0 / self.args.move_rate if self.args.move_rate > 0 else None
+        next_chat = time.perf_counter() + self.args.chat_interval * (index + 1) / self.args.bots
+        serial = itertools.count()
+        while not self.stopping.is_set():
+            now = time.perf_counter()
+            if self.args.chat_interval > 0 and now >= next_chat:
+                token = '%d.%d' % (index, next(serial))
+                self.sent[token] = now
+                conn.send('chat_message', Buffer.pack_string('swarm %s' % token))
+                self.chats += 1
+                next_chat += self.args.chat_interval
+            if move_every is not None:
+                x += 0.1
+                conn.send('player_position', Buffer.pack('ddd?', x, 64.0, z, True))
+                self.moves += 1
+            try: await asyncio.wait_for(self.stopping.wait(), move_every or self.args.chat_interval)
+            except asyncio.TimeoutError: pass
+        conn.close()
+    async def run(self, process):
+        pinging = time.perf_counter()
+        await asyncio.gather(*[self.pinger(index) for index in range(self.args.bots)])
+        pinging = time.perf_counter() - pinging
+        base_rss, base_cpu = process.sample()
+        bots = [asyncio.ensure_future(self.bot(index)) for index in range(self.args.bots)]
+        await asyncio.wait_for(self.playing.wait(), self.args.join_timeout)
+        joined_rss, joined_cpu = process.sample()
+        playing = time.perf_counter()
+        await asyncio.sleep(self.args.duration)
+        played_rss, played_cpu = process.sample()
+        playing = time.perf_counter() - playing
+        self.stopping.set()
+        await asyncio.gather(*bots, return_exceptions=True)
+        return pinging, playing, (base_rss, base_cpu), (joined_rss, joined_cpu), (played_rss, played_cpu)
+class Process(object):
+    def __init__(self, pid): self.pid = pid
+    def sample(self):
+        if self.pid is None: return None, None
+        try:
+            with open('/proc/%d/status' % self.pid) as f: rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+            with open('/proc/%d/stat' % self.pid) as f: fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, StopIteration): return None, None
+        return rss, (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+def percentiles(samples):
+    if not samples: return 'no samples'
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+    return 'p50 %7.2f ms  p90 %7.2f ms  p99 %7.2f ms  max %7.2f ms  (%d samples)' % (pick(0.5), pick(0.9), pick(0.99), samples[-1] * 1000, len(samples))
+def spawn(port, settings=None):
+    # Runs main.py from a scratch folder holding server.properties with settings applied, so limits can be raised for the test
+    folder = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, folder, True)
+    settings = dict(settings or {})
+    with open(os.path.join(root, 'server.properties')) as f: lines = f.read().splitlines()
+    for i, line in enumerate(lines):
+        key = line.split('=', 1)[0]
+        if key in settings: lines[i] = '%s=%s' % (key, settings.pop(key))
+    lines += ['%s=%s' % item for item in settings.items()]
+    with open(os.path.join(folder, 'server.properties'), 'w') as f: f.write('\n'.join(lines) + '\n')
+    for name in ('plugins', 'world'):
+        if os.path.exists(os.path.join(root, name)): os.symlink(os.path.join(root, name), os.path.join(folder, name))
+    server = subprocess.Popen([sys.executable, os.path.join(root, 'main.py'), str(port)], cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.2).close()
+            return server
+        except OSError: time.sleep(0.1)
+    server.kill()
+    raise SystemExit('Server did not start listening on port %d' % port)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bots', type=int, default=100)
+    parser.add_argument('--versions', default='47,340')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=25590)
+    parser.add_argument('--pings', type=int, default=5, help='status pings per bot before logging in')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of chatting and moving')
+    parser.add_argument('--chat-interval', type=float, default=2, help='seconds between chat messages per bot')
+    parser.add_argument('--move-rate', type=float, default=20, help='position packets per second per bot')
+    parser.add_argument('--join-timeout', type=float, default=60)
+    parser.add_argument('--no-spawn', action='store_true', help='use a server that is already running')
+    parser.add_argument('--pid', type=int, help='server pid to sample RSS and CPU from with --no-spawn')
+    args = parser.parse_args()
+    for version in args.versions.split(','):
+        if int(version) not in packets.minecraft_versions: raise SystemExit('Unknown protocol version: %s' % version)
+    server = None if args.no_spawn else spawn(args.port, {'max-players': args.bots + 10})
+    process = Process(server.pid if server is not None else args.pid)
+    swarm = Swarm(args)
+    try: pinging, playing, base, joined, played = asyncio.get_event_loop().run_until_complete(swarm.run(process))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print('bots %d, versions %s' % (args.bots, args.versions))
+    print('status ping     %s' % percentiles(swarm.pings))
+    print('pings/sec       %.0f' % (len(swarm.pings) / pinging))
+    print('join latency    %s' % percentiles(swarm.joins))
+    print('chat fan-out    %s' % percentiles(swarm.fanout))
+    print('chat delivered  %d of %d expected' % (len(swarm.fanout), swarm.chats * args.bots))
+    print('moves/sec       %.0f' % (swarm.moves / playing))
+    if base[0] is not None and joined[0] is not None and played[0] is not None:
+        print('server RSS      %.1f MiB idle, %.1f MiB with bots, %.1f KiB per connection' % (base[0] / 1048576.0, played[0] / 1048576.0, (played[0] - base[0]) / 1024.0 / args.bots))
+        print('server CPU      %.2f ms per join, %.3f ms/s per connection while playing' % ((joined[1] - base[1]) * 1000 / args.bots, (played[1] - joined[1]) * 1000 / playing / args.bots))
+    if swarm.errors: print('%d errors, first: %s' % (len(swarm.errors), swarm.errors[0]))
@@ -0,0 +1,43 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Keep-alive timer overhead for many simulated players: one LoopingCall each, one wheel timer each, or one sweep.
+# python benchmarks/timers.py [players] [seconds]
+import os, subprocess, sys, time
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+def simulate(mode, count, seconds):
+    os.chdir(root)
+    from twisted.internet import reactor
+    from twisted.internet.task import LoopingCall
+    from main import AuthServer, AuthProtocol
+    from fakes import Address, Transport
+    server = AuthServer()
+    server.log_writer.echo = False
+    start = time.process_time()
+    loops, transports = [], []
+    for i in range(count):
+        player = AuthProtocol(server, Address())
+        player.protocol_version, player.protocol_mode = (47, 107, 210, 340)[i % 4], 3
+        player.transport = Transport()
+        transports.append(player.transport)
+        player.keep_alive_at = float('inf')
+        if mode == 'loopingcall':
+            loop = LoopingCall(player.send_keep_alive)
+            loop.start(5, now=False)
+            loops.append(loop)
+        elif mode == 'wheel': player.tasks.add_loop(5, player.send_keep_alive)
+        else: server.players.add(player)
+    setup = time.process_time() - start
+    server.timers.start()
+    heap = len(reactor.getDelayedCalls())
+    reactor.callLater(seconds, reactor.stop)
+    start = time.process_time()
+    reactor.run()
+    print('%-12s %6d players setup %7.1f ms  run %7.1f ms cpu  %6d delayed calls  %7d writes' % (mode, count, setup * 1000, (time.process_time() - start) * 1000, heap, sum(t.writes for t in transports)))
+    sys.stdout.flush()
+    os._exit(0)
+if __name__ == '__main__':
+    if len(sys.argv) > 3: simulate(sys.argv[3], int(sys.argv[1]), float(sys.argv[2]))
+    count = sys.argv[1] if len(sys.argv) > 1 else '10000'
+    seconds = sys.argv[2] if len(sys.argv) > 2 else '11'
+    for mode in ('loopingcall', 'wheel', 'sweep'): subprocess.call([sys.executable, os.path.abspath(__file__), count, seconds, mode])
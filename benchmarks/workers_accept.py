@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Loopback load test: completed connect + status + ping cycles per second against main.py --workers N.
+# python benchmarks/workers_accept.py [seconds] [clients] [workers...]
+import multiprocessing, os, shutil, socket, struct, subprocess, sys, tempfile, time
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+from main import Buffer
+from fakes import frame
+def client(port, seconds, result):
+    request = frame(0, Buffer.pack_varint(340) + Buffer.pack_string('localhost') + Buffer.pack('H', port) + Buffer.pack_varint(1)) + frame(0, b'') + frame(1, Buffer.pack('Q', 0))
+    done, failed = 0, 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+            sock.sendall(request)
+            while sock.recv(65536): pass
+            sock.close()
+            done += 1
+        except OSError: failed += 1
+    result.put((done, failed))
+def run(workers, port, seconds, clients):
+    folder = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(folder, 'server.properties'), 'w') as properties:
+            properties.write('[server]\nserver-port=%d\nserver-ip=127.0.0.1\ndebug=false\nmax-players=20\nprint-ping=false\nmotd=Bench\nlog-file=%s\n' % (port, os.path.join(folder, 'logger.log')))
+        os.mkdir(os.path.join(folder, 'plugins'))
+        server = subprocess.Popen([sys.executable, os.path.join(root, 'main.py'), '--workers', str(workers)], cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(2 + 0.5 * workers)
+        result = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=client, args=(port, seconds, result)) for i in range(clients)]
+        for proc in procs: proc.start()
+        totals = [result.get() for proc in procs]
+        for proc in procs: proc.join()
+        server.terminate()
+        server.wait(15)
+        return sum(done for done, failed in totals), sum(failed for done, failed in totals)
+    finally: shutil.rmtree(folder, ignore_errors=True)
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    counts = [int(arg) for arg in sys.argv[3:]] or [1, 2, 4]
+    print('%d CPUs, %d client processes, %.0f s per run' % (os.cpu_count(), clients, seconds))
+    for i, workers in enumerate(counts):
+        done, failed = run(workers, 25700 + i, seconds, clients)
+        print('%2d workers %10.0f connections/s %6d failed' % (workers, done / seconds, failed))
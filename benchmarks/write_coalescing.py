@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Transport writes and bytes per write for the login burst, a title and a chat broadcast, with and without corking.
+# python benchmarks/write_coalescing.py [players]
+import os, sys
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+from main import AuthServer, AuthProtocol, Buffer
+from fakes import Address, Transport, frame
+def totals(transports): return sum(t.writes for t in transports), sum(t.bytes for t in transports)
+def report(label, corking, count, before, after):
+    writes, size = after[0] - before[0], after[1] - before[1]
+    print('%-9s %-22s %8d writes %7.2f writes/player %8.1f bytes/write' % ('corked' if corking else 'uncorked', label, writes, writes / float(count), size / float(writes or 1)))
+def scenario(server, count, corking):
+    if not corking: AuthProtocol.cork = lambda self: None
+    players, login = [], [0, 0]
+    for i in range(count):
+        player = AuthProtocol(server, Address())
+        player.transport = Transport()
+        player.dataReceived(frame(0, Buffer.pack_varint(340) + Buffer.pack_string('localhost') + Buffer.pack('H', 25565) + Buffer.pack_varint(2)) + frame(0, Buffer.pack_string('bot%d' % i)))
+        server.flush_corked()
+        login[0] += player.transport.writes
+        login[1] += player.transport.bytes
+        players.append(player)
+    transports = [player.transport for player in players]
+    report('login burst', corking, count, (0, 0), login)
+    before = totals(transports)
+    for player in players:
+        player.cork()
+        player.send_title('Welcome', 'to the lobby', 10, 70, 20)
+    server.flush_corked()
+    report('title', corking, count, before, totals(transports))
+    before = totals(transports)
+    for i in range(5): players[0].send_chat_all('announcement %d' % i)
+    server.flush_corked()
+    report('5 chat broadcasts', corking, count, before, totals(transports))
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    cork = AuthProtocol.cork
+    for corking in (False, True):
+        AuthProtocol.cork = cork
+        server = AuthServer()
+        server.log_writer.echo = False
+        server.max_players = count
+        scenario(server, count, corking)
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import mmap, os, struct, zlib
+import numpy as np
+sector_size = 4096
+shifts = np.arange(64, dtype=np.uint64)
+layouts = {}
+def pack_varints(values):
+    values = np.asarray(values, dtype=np.uint32).ravel()
+    groups = np.stack((values & 0x7F, (values >> 7) & 0x7F, (values >> 14) & 0x7F, (values >> 21) & 0x7F, values >> 28), axis=1)
+    lengths = 1 + (values >= 0x80) + (values >= 0x4000) + (values >= 0x200000) + (values >= 0x10000000)
+    used = np.arange(5) < lengths[:, None]
+    groups[:, :4] |= (np.arange(1, 5) < lengths[:, None]) * np.uint32(0x80)
+    return groups[used].astype(np.uint8).tobytes()
+def pack_nibbles(values):
+    values = values.astype(np.uint8)
+    return (values[0::2] & 15) | (values[1::2] << 4)
+def unpack_nibbles(data):
+    values = np.empty(len(data) * 2, dtype=np.uint8)
+    values[0::2], values[1::2] = data & 15, data >> 4
+    return values
+def long_layout(bits, count):
+    key = (bits, count)
+    if key not in layouts:
+        offsets = np.arange(count, dtype=np.uint64) * np.uint64(bits)
+        index, shift = (offsets >> np.uint64(6)).astype(np.intp), offsets & np.uint64(63)
+        spill = np.flatnonzero(shift + np.uint64(bits) > 64)
+        layouts[key] = (np.flatnonzero(np.diff(index, prepend=-1)), shift, spill, index[spill] + 1, np.uint64(64) - shift[spill])
+    return layouts[key]
+def pack_longs(values, bits):
+    starts, shift, spill, spill_index, spill_shift = long_layout(bits, len(values))
+    values = values.astype(np.uint64)
+    longs = np.add.reduceat(values << shift, starts)
+    longs[spill_index] += values[spill] >> spill_shift
+    return longs.astype('>u8')
+def unpack_longs(longs, bits, count=4096):
+    flags = np.unpackbits(np.asarray(longs, dtype='>u8').astype('<u8').view(np.uint8), bitorder='little')[:count * bits]
+    return np.bitwise_or.reduce(flags.reshape(count, bits).astype(np.uint64) << shifts[:bits], axis=1)
+class Section(object):
+    __slots__ = ('blocks', 'block_light', 'sky_light', 'encoded')
+    def __init__(self, blocks, block_light=None, sky_light=None):
+        self.blocks = np.asarray(blocks, dtype=np.uint16).reshape(4096)
+        self.block_light = np.zeros(2048, dtype=np.uint8) if block_light is None else np.asarray(block_light, dtype=np.uint8)
+        self.sky_light = np.full(2048, 0xFF, dtype=np.uint8) if sky_light is None else np.asarray(sky_light, dtype=np.uint8)
+        self.encoded = None
+    def palette(self):
+        counts = np.bincount(self.blocks)
+        palette = np.flatnonzero(counts)
+        lookup = np.empty(len(counts), dtype=np.uint16)
+        lookup[palette] = np.arange(len(palette))
+        indices = lookup[self.blocks]
+        bits = max(4, (len(palette) - 1).bit_length())
+        if bits > 8: return 13, None, self.blocks
+        return bits, palette, indices
+    def encode(self):
+        if self.encoded is None:
+            bits, palette, indices = self.palette()
+            longs = pack_longs(indices, bits)
+            self.encoded = b''.join((bytes((bits,)), pack_varints(len(palette) if palette is not None else 0), pack_varints(palette) if palette is not None else b'',
+                pack_varints(len(longs)), longs.tobytes(), self.block_light.tobytes(), self.sky_light.tobytes()))
+        return self.encoded
+class Chunk(object):
+    def __init__(self, x, z, sections=None, biomes=None):
+        self.x, self.z = x, z
+        self.sections = {} if sections is None else sections
+        self.biomes = np.ones(256, dtype=np.uint8) if biomes is None else np.asarray(biomes, dtype=np.uint8)
+    def mask(self):
+        mask = 0
+        for y in self.sections: mask |= 1 << y
+        return mask
+    def ordered(self): return [self.sections[y] for y in sorted(self.sections)]
+    def column(self, protocol_version):
+        sections = self.ordered()
+        if protocol_version >= 107: data = [section.encode() for section in sections]
+        elif protocol_version >= 47: data = [np.concatenate([section.blocks for section in sections]).astype('<u2').tobytes() if sections else b'']
+        else:
+            blocks = np.concatenate([section.blocks for section in sections]) if sections else np.zeros(0, dtype=np.uint16)
+            data = [(blocks >> 4).astype(np.uint8).tobytes(), pack_nibbles(blocks & 15).tobytes()]
+        if protocol_version < 107:
+            data += [section.block_light.tobytes() for section in sections] + [section.sky_light.tobytes() for section in sections]
+        return self.mask(), b''.join(data) + self.biomes.tobytes()
+class NBTReader(object):
+    scalars = {1: struct.Struct('>b'), 2: struct.Struct('>h'), 3: struct.Struct('>i'), 4: struct.Struct('>q'), 5: struct.Struct('>f'), 6: struct.Struct('>d')}
+    arrays = {7: (np.uint8, 1), 11: ('>i4', 4), 12: ('>i8', 8)}
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+    def read_root(self):
+        tag = self.data[0]
+        self.pos = 1
+        self.read_string()
+        return self.read(tag)
+    def read_string(self):
+        length, = struct.unpack_from('>H', self.data, self.pos)
+        self.pos += 2 + length
+        return bytes(self.data[self.pos - length:self.pos]).decode('utf-8')
+    def read(self, tag):
+        if tag in self.scalars:
+            value, = self.scalars[tag].unpack_from(self.data, self.pos)
+            self.pos += self.scalars[tag].size
+            return value
+        if tag in self.arrays:
+            dtype, size = self.arrays[tag]
+            length, = struct.unpack_from('>i', self.data, self.pos)
+            value = np.frombuffer(self.data, dtype=dtype, count=length, offset=self.pos + 4)
+            self.pos += 4 + length * size
+            return value
+        if tag == 8: return self.read_string()
+        if tag == 9:
+            item, length = struct.unpack_from('>bi', self.data, self.pos)
+            self.pos += 5
+            return [self.read(item) for i in range(length)]
+        if tag == 10:
+            value = {}
+            while True:
+                item = self.data[self.pos]
+                self.pos += 1
+                if item == 0: return value
+                name = self.read_string()
+                value[name] = self.read(item)
+        raise ValueError('Unknown NBT tag: %s' % tag)
+def nbt_array(tag, name, data): return struct.pack('>bH', tag, len(name)) + name + struct.pack('>i', len(data)) + data.tobytes()
+def nbt_scalar(tag, name, fmt, value): return struct.pack('>bH', tag, len(name)) + name + struct.pack(fmt, value)
+def chunk_nbt(chunk):
+    sections = []
+    for y in sorted(chunk.sections):
+        section = chunk.sections[y]
+        ids = section.blocks >> 4
+        data = [nbt_scalar(1, b'Y', '>b', y), nbt_array(7, b'Blocks', (ids & 0xFF).astype(np.uint8)), nbt_array(7, b'Data', pack_nibbles(section.blocks & 15)),
+            nbt_array(7, b'BlockLight', section.block_light), nbt_array(7, b'SkyLight', section.sky_light)]
+        if ids.max() > 0xFF: data.append(nbt_array(7, b'Add', pack_nibbles(ids >> 8)))
+        sections.append(b''.join(data) + b'\x00')
+    level = b''.join((nbt_scalar(3, b'xPos', '>i', chunk.x), nbt_scalar(3, b'zPos', '>i', chunk.z), nbt_array(7, b'Biomes', chunk.biomes),
+        struct.pack('>bH', 9, 8) + b'Sections' + struct.pack('>bi', 10, len(sections)) + b''.join(sections)))
+    return b'\x0a\x00\x00' + struct.pack('>bH', 10, 5) + b'Level' + level + b'\x00\x00'
+def read_chunk(data):
+    level = NBTReader(data).read_root()['Level']
+    sections = {}
+    for section in level.get('Sections', ()):
+        if 'Blocks' not in section: continue
+        blocks = section['Blocks'].astype(np.uint16)
+        if 'Add' in section: blocks |= unpack_nibbles(section['Add']).astype(np.uint16) << 8
+        blocks = (blocks << 4) | unpack_nibbles(section['Data'])
+        if blocks.any(): sections[section['Y']] = Section(blocks, section.get('BlockLight'), section.get('SkyLight'))
+    return Chunk(level['xPos'], level['zPos'], sections, level.get('Biomes'))
+class RegionFile(object):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try: self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: self.map = b''
+        self.locations = np.frombuffer(self.map, dtype='>u4', count=1024) if len(self.map) >= sector_size else np.zeros(1024, dtype='>u4')
+    def read(self, chunk_x, chunk_z):
+        location = int(self.locations[(chunk_x & 31) + (chunk_z & 31) * 32])
+        if location == 0: return None
+        start = (location >> 8) * sector_size
+        length, compression = struct.unpack_from('>iB', self.map, start)
+        data = self.map[start + 5:start + 4 + length]
+        if compression == 1: data = zlib.decompress(data, 31)
+        elif compression == 2: data = zlib.decompress(data)
+        elif compression != 3: raise ValueError('Unknown chunk compression: %s' % compression)
+        return read_chunk(data)
+    def close(self):
+        self.locations = None
+        if isinstance(self.map, mmap.mmap): self.map.close()
+        self.file.close()
+    @staticmethod
+    def save(path, chunks):
+        header, body = np.zeros(2048, dtype='>u4'), []
+        sector = 2
+        for chunk in chunks:
+            data = zlib.compress(chunk_nbt(chunk))
+            data = struct.pack('>iB', len(data) + 1, 2) + data
+            data += b'\x00' * (-len(data) % sector_size)
+            header[(chunk.x & 31) + (chunk.z & 31) * 32] = (sector << 8) | (len(data) // sector_size)
+            body.append(data)
+            sector += len(data) // sector_size
+        with open(path, 'wb') as region: region.write(header.tobytes() + b''.join(body))
+class World(object):
+    def __init__(self, folder):
+        self.folder = folder
+        self.regions = {}
+    def region(self, region_x, region_z):
+        key = (region_x, region_z)
+        if key not in self.regions:
+            path = os.path.join(self.folder, 'region', 'r.%d.%d.mca' % key)
+            self.regions[key] = RegionFile(path) if os.path.exists(path) else None
+        return self.regions[key]
+    def get_chunk(self, chunk_x, chunk_z):
+        region = self.region(chunk_x >> 5, chunk_z >> 5)
+        chunk = region.read(chunk_x, chunk_z) if region is not None else None
+        return Chunk(chunk_x, chunk_z) if chunk is None else chunk
+    def close(self):
+        for region in self.regions.values():
+            if region is not None: region.close()
+        self.regions.clear()
@@ -0,0 +1,20 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
+try: from cryptography.hazmat.decrepit.ciphers.modes import CFB8
+except ImportError: from cryptography.hazmat.primitives.ciphers.modes import CFB8
+class Encryption(object):
+    def __init__(self, bits=1024):
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+        self.public_key = self.private_key.public_key().public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    @staticmethod
+    def token(): return os.urandom(4)
+    def decrypt(self, data): return self.private_key.decrypt(data, padding.PKCS1v15())
+    @staticmethod
+    def ciphers(secret):
+        # The shared secret is both key and IV; each context carries the CFB8 stream state for the whole connection
+        cipher = Cipher(algorithms.AES(secret), CFB8(secret))
+        return cipher.encryptor(), cipher.decryptor()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import math
+class Grid(object):
+    def __init__(self, cell=16):
+        self.cell = cell
+        self.cells = {}
+    def cell_of(self, x, z): return int(math.floor(x)) // self.cell, int(math.floor(z)) // self.cell
+    def add(self, item, cell):
+        self.cells.setdefault(cell, set()).add(item)
+    def remove(self, item, cell):
+        items = self.cells.get(cell)
+        if items is None: return
+        items.discard(item)
+        if not items: del self.cells[cell]
+    def move(self, item, old, new):
+        self.remove(item, old)
+        self.add(item, new)
+    def near_cell(self, cell, radius):
+        found = set()
+        cells = self.cells
+        cell_x, cell_z = cell
+        if len(cells) < (2 * radius + 1) ** 2:
+            for (x, z), items in cells.items():
+                if abs(x - cell_x) <= radius and abs(z - cell_z) <= radius: found |= items
+            return found
+        for x in range(cell_x - radius, cell_x + radius + 1):
+            for z in range(cell_z - radius, cell_z + radius + 1):
+                items = cells.get((x, z))
+                if items: found |= items
+        return found
+    def near(self, x, z, radius): return self.near_cell(self.cell_of(x, z), radius)
+class Tracked(object):
+    __slots__ = ('player', 'cell', 'viewers', 'fixed', 'precise')
+    def __init__(self, player, cell):
+        self.player = player
+        self.cell = cell
+        self.viewers = set()
+        self.fixed = self.precise = None
+class Interest(object):
+    def __init__(self, radius=3, cell=16):
+        self.radius = radius
+        self.grid = Grid(cell)
+        self.tracked = {}
+        self.moved = set()
+        self.entered = set()
+        self.spawns = self.destroys = self.moves = 0
+    def add(self, player):
+        tracked = self.tracked[player] = Tracked(player, self.grid.cell_of(player.play.x, player.play.z))
+        self.grid.add(player, tracked.cell)
+        self.remember(tracked)
+        self.entered.add(player)
+    def remove(self, player):
+        tracked = self.tracked.pop(player, None)
+        if tracked is None: return
+        self.grid.remove(player, tracked.cell)
+        self.moved.discard(player)
+        self.entered.discard(player)
+        for viewer in tracked.viewers:
+            self.tracked[viewer].viewers.discard(player)
+            viewer.cork()
+            viewer.send_destroy_entities((player.play.entity_id,))
+            self.destroys += 1
+    def moved_player(self, player):
+        if player in self.tracked: self.moved.add(player)
+    def near(self, x, z, radius=None): return self.grid.near(x, z, self.radius if radius is None else radius)
+    def viewers(self, player):
+        tracked = self.tracked.get(player)
+        return tracked.viewers if tracked is not None else set()
+    @staticmethod
+    def remember(tracked):
+        play = tracked.player.play
+        tracked.fixed = (int(math.floor(play.x * 32)), int(math.floor(play.y * 32)), int(math.floor(play.z * 32)))
+        tracked.precise = (int(round(play.x * 4096)), int(round(play.y * 4096)), int(round(play.z * 4096)))
+    def tick(self):
+        moved, self.moved = self.moved, set()
+        changed, self.entered = self.entered, set()
+        for player in moved:
+            tracked = self.tracked[player]
+            if tracked.viewers:
+                old = (tracked.fixed, tracked.precise)
+                self.remember(tracked)
+                encoded = {}
+                for viewer in tracked.viewers:
+                    key = (viewer.protocol_version, viewer.compression)
+                    packet = encoded.get(key)
+                    if packet is None: packet = encoded[key] = viewer.encode_entity_move(player, old, (tracked.fixed, tracked.precise))
+                    viewer.cork()
+                    viewer.write(packet)
+                self.moves += len(tracked.viewers)
+            else: self.remember(tracked)
+            cell = self.grid.cell_of(player.play.x, player.play.z)
+            if cell != tracked.cell:
+                self.grid.move(player, tracked.cell, cell)
+                tracked.cell = cell
+                changed.add(player)
+        for player in changed:
+            tracked = self.tracked.get(player)
+            if tracked is None: continue
+            near = self.grid.near_cell(tracked.cell, self.radius)
+            near.discard(player)
+            entered, left = near - tracked.viewers, tracked.viewers - near
+            for other in entered:
+                tracked.viewers.add(other)
+                self.tracked[other].viewers.add(player)
+                player.cork()
+                other.cork()
+                player.send_spawn_entity(other)
+                other.send_spawn_entity(player)
+            if left:
+                player.cork()
+                player.send_destroy_entities([other.play.entity_id for other in left])
+                for other in left:
+                    tracked.viewers.discard(other)
+                    self.tracked[other].viewers.discard(player)
+                    other.cork()
+                    other.send_destroy_entities((player.play.entity_id,))
+            self.spawns += 2 * len(entered)
+            self.destroys += 2 * len(left)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import collections, datetime, os, sys, threading, time
+class LogWriter(object):
+    def __init__(self, path='logger.log', echo=True, queue_size=10000, batch_size=256, flush_interval=0.5, max_bytes=10485760, backups=3, block_timeout=0):
+        self.path = path
+        self.echo = echo
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.block_timeout = block_timeout
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = self.urgent = False
+        self.queued = self.written = self.lost = self.dropped = self.reported = self.flushes = self.rotations = self.errors = 0
+        self.file = None
+        self.thread = threading.Thread(target=self.run, name='log-writer', daemon=True)
+        self.thread.start()
+    def write(self, line):
+        with self.cond:
+            if self.closed: return False
+            if len(self.queue) >= self.queue_size:
+                if self.block_timeout <= 0 or not self.cond.wait_for(lambda: len(self.queue) < self.queue_size or self.closed, self.block_timeout) or self.closed:
+                    self.dropped += 1
+                    return False
+            self.queue.append(line)
+            self.queued += 1
+            if len(self.queue) >= self.batch_size: self.cond.notify_all()
+        return True
+    def flush(self, timeout=5):
+        with self.cond:
+            target = self.queued
+            self.urgent = True
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self.written + self.lost >= target or not self.thread.is_alive(), timeout)
+    def close(self, timeout=5):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+    def run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            with self.cond:
+                while len(self.queue) < self.batch_size and not self.closed and not self.urgent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0: break
+                    self.cond.wait(remaining)
+                batch = list(self.queue)
+                self.queue.clear()
+                self.urgent = False
+                if self.dropped > self.reported:
+                    batch.append(self.format('%d log records dropped, writer could not keep up' % (self.dropped - self.reported)))
+                    self.reported = self.dropped
+                    self.queued += 1
+                closed = self.closed
+                self.cond.notify_all()
+            if batch: self.write_batch(batch)
+            with self.cond:
+                self.cond.notify_all()
+            if closed and not batch: break
+        if self.file is not None: self.file.close()
+    def write_batch(self, batch):
+        text = ''.join(batch)
+        if self.echo:
+            try:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            except (OSError, ValueError): pass
+        try:
+            if self.file is None: self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(text)
+            self.file.flush()
+            if self.max_bytes and self.file.tell() >= self.max_bytes: self.rotate()
+        except OSError:
+            self.errors += 1
+            self.lost += len(batch)
+            if self.file is not None:
+                try: self.file.close()
+                except OSError: pass
+            self.file = None
+        else:
+            self.written += len(batch)
+            self.flushes += 1
+    def rotate(self):
+        self.file.close()
+        self.file = None
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists('%s.%d' % (self.path, i)): os.replace('%s.%d' % (self.path, i), '%s.%d' % (self.path, i + 1))
+        if self.backups > 0: os.replace(self.path, '%s.1' % self.path)
+        else: os.remove(self.path)
+        self.rotations += 1
+    @staticmethod
+    def format(message): return '%s | %s\n' % (datetime.datetime.now().strftime('[%H:%M:%S]'), message)
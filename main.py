@@ -1,74 +1,170 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
-from twisted.internet import protocol, reactor
+from twisted.internet import protocol, reactor, threads
 from twisted.internet.task import LoopingCall
 from os.path import abspath
 from plugin_core import PluginSystem
-import struct, json, zlib, sys, packets, configparser, datetime
+from logwriter import LogWriter
+from twisted.web.server import Site
+import struct, json, zlib, sys, packets, configparser, collections, argparse, traceback, math, workers, chunks, metrics, admission, interest, encryption, hashlib, uuid
 class BufferUnderrun(Exception): pass
+class Timer(object):
+    __slots__ = ('wheel', 'delay', 'interval', 'callback', 'args', 'due', 'slot')
+    def __init__(self, wheel, delay, interval, callback, args):
+        self.wheel, self.delay, self.interval, self.callback, self.args = wheel, delay, interval, callback, args
+        self.slot = None
+    def active(self): return self.slot is not None
+    def cancel(self):
+        if self.slot is None: raise ValueError('Timer is not active')
+        self.slot.discard(self)
+        self.slot = None
+    def stop(self):
+        if self.slot is not None: self.cancel()
+    def reset(self, delay):
+        self.stop()
+        self.wheel.insert(self, delay)
+    def restart(self):
+        if self.slot is not None: self.reset(self.delay)
+class TimerWheel(object):
+    def __init__(self, tick=0.05, size=1024, clock=reactor):
+        self.tick = tick
+        self.size = size
+        self.clock = clock
+        self.slots = [set() for i in range(size)]
+        self.ticks = 0
+        self.started = None
+        self.loop = None
+        self.log = None
+    def start(self):
+        self.started = self.clock.seconds() - self.ticks * self.tick
+        self.loop = LoopingCall(self.advance)
+        self.loop.clock = self.clock
+        self.loop.start(self.tick, now=False)
+    def stop(self):
+        if self.loop is not None and self.loop.running: self.loop.stop()
+    def call_later(self, delay, callback, *args):
+        timer = Timer(self, delay, None, callback, args)
+        self.insert(timer, delay)
+        return timer
+    def call_every(self, interval, callback, *args):
+        timer = Timer(self, interval, interval, callback, args)
+        self.insert(timer, interval)
+        return timer
+    def insert(self, timer, delay):
+        timer.due = self.ticks + max(1, math.ceil(delay / self.tick - 1e-9))
+        timer.slot = self.slots[timer.due % self.size]
+        timer.slot.add(timer)
+    def advance(self):
+        target = int((self.clock.seconds() - self.started) / self.tick + 1e-9)
+        while self.ticks < target:
+            self.ticks += 1
+            slot = self.slots[self.ticks % self.size]
+            if not slot: continue
+            expired = [timer for timer in slot if timer.due <= self.ticks]
+            for timer in expired:
+                slot.discard(timer)
+                timer.slot = None
+                if timer.interval is not None: self.insert(timer, timer.interval)
+            # A failing callback is reported and an interval timer keeps its next run, so one bad sweep does not end the loop
+            for timer in expired:
+                try: timer.callback(*timer.args)
+                except Exception:
+                    if self.log is None: traceback.print_exc()
+                    else: self.log('Timer callback %r failed\n%s' % (timer.callback, traceback.format_exc().rstrip()))
 class Tasks(object):
-    def __init__(self):
+    __slots__ = ('wheel', '_tasks')
+    def __init__(self, wheel):
+        self.wheel = wheel
         self._tasks = []
     def add_loop(self, time, callback, *args):
-        task = LoopingCall(callback, *args)
-        task.start(time, now=False)
-        self._tasks.append(task)
-        return task
+        return self.track(self.wheel.call_every(time, callback, *args))
     def add_delay(self, time, callback, *args):
-        task = reactor.callLater(time, callback, *args)
-        def stop():
-            if task.active(): task.cancel()
-        def restart():
-            if task.active(): task.reset(time)
-        task.restart = restart
-        task.stop = stop
+        return self.track(self.wheel.call_later(time, callback, *args))
+    def track(self, task):
+        if len(self._tasks) >= 32: self._tasks = [other for other in self._tasks if other.active()]
         self._tasks.append(task)
         return task
     def stop_all(self):
-        while len(self._tasks) > 0:
-            task = self._tasks.pop(0)
-            task.stop()
+        tasks, self._tasks = self._tasks, []
+        for task in tasks: task.stop()
 class ProtocolError(Exception):
     @classmethod
     def mode_mismatch(cls, ident, mode): return cls('Unexpected packet; ID: {0}; Mode: {1}'.format(ident, mode))
     @classmethod
     def step_mismatch(cls, ident, step): return cls('Unexpected packet; ID: {0}; Step: {1}'.format(ident, step))
 class Buffer(object):
-    def __init__(self):
-        self.buff1 = b''
-        self.buff2 = b''
-    def length(self): return len(self.buff1)
-    def add(self, data): self.buff1 += data
-    def save(self): self.buff2 = self.buff1
-    def restore(self): self.buff1 = self.buff2
+    structs = {}
+    varints = [bytes((i,)) for i in range(0x80)]
+    def __init__(self, data=b''):
+        # A single packet body is read in place, a stream buffer gets a bytearray to grow
+        self.buff1 = data if type(data) is bytes and data else bytearray(data)
+        self.pos = 0
+        self.mark = 0
+    def length(self): return len(self.buff1) - self.pos
+    def add(self, data):
+        if type(self.buff1) is bytes: self.buff1 = bytearray(self.buff1)
+        if self.mark and self.mark * 2 >= len(self.buff1): self.compact()
+        self.buff1 += data
+    def compact(self):
+        del self.buff1[:self.mark]
+        self.pos -= self.mark
+        self.mark = 0
+    def save(self): self.mark = self.pos
+    def restore(self): self.pos = self.mark
     def unpack_raw(self, l):
-        if len(self.buff1) < l: raise BufferUnderrun()
-        d, self.buff1 = self.buff1[:l], self.buff1[l:]
-        return d
+        pos = self.pos
+        if len(self.buff1) - pos < l: raise BufferUnderrun()
+        self.pos = pos + l
+        return bytes(memoryview(self.buff1)[pos:pos + l])
     def unpack(self, ty):
-        s = struct.unpack('>'+ty, self.unpack_raw(struct.calcsize(ty)))
+        st = self.structs.get(ty) or self.get_struct(ty)
+        pos = self.pos
+        if len(self.buff1) - pos < st.size: raise BufferUnderrun()
+        self.pos = pos + st.size
+        s = st.unpack_from(self.buff1, pos)
         return s[0] if len(ty) == 1 else s
     def unpack_string(self): return self.unpack_raw(self.unpack_varint()).decode('utf-8')
     def unpack_array(self): return self.unpack_raw(self.unpack('h'))
     def unpack_varint(self):
+        buff, pos = self.buff1, self.pos
+        if pos < len(buff) and buff[pos] < 0x80:
+            self.pos = pos + 1
+            return buff[pos]
         d = 0
         for i in range(5):
-            b = self.unpack('B')
+            if pos >= len(buff): raise BufferUnderrun()
+            b = buff[pos]
+            pos += 1
             d |= (b & 0x7F) << 7*i
             if not b & 0x80: break
+        self.pos = pos
         return d
     def unpack_json(self):
         obj = json.loads(self.unpack_string())
         return obj
     def unpack_chat(self): return self.unpack_json()
     @classmethod
-    def pack_uuid(cls, uuid): return uuid.to_bytes()
+    def get_struct(cls, ty):
+        st = cls.structs.get(ty)
+        if st is None: st = cls.structs[ty] = struct.Struct('>'+ty)
+        return st
+    @classmethod
+    def unpack_from(cls, ty, buff, offset=0):
+        s = (cls.structs.get(ty) or cls.get_struct(ty)).unpack_from(buff, offset)
+        return s[0] if len(ty) == 1 else s
+    @classmethod
+    def pack_into(cls, ty, buff, offset, *data):
+        st = cls.structs.get(ty) or cls.get_struct(ty)
+        st.pack_into(buff, offset, *data)
+        return offset + st.size
+    @classmethod
+    def pack_uuid(cls, uuid): return uuid.bytes if hasattr(uuid, 'bytes') else uuid.to_bytes(16, 'big')
     @classmethod
     def pack_json(cls, obj): return cls.pack_string(json.dumps(obj))
     @classmethod
     def pack_chat(cls, text): return cls.pack_json({'text': text})
     @classmethod
-    def pack(cls, ty, *data): return struct.pack('>'+ty, *data)
+    def pack(cls, ty, *data): return (cls.structs.get(ty) or cls.get_struct(ty)).pack(*data)
     @classmethod
     def pack_slot(cls, id=-1, count=1, damage=0, tag=None): return cls.pack('hbh', id, count, damage) + cls.pack_nbt(tag)
     @classmethod
@@ -83,207 +179,765 @@ class Buffer(object):
     def pack_array(cls, data): return cls.pack('h', len(data)) + data
     @classmethod
     def pack_varint(cls, d):
-        o = b''
-        while True:
-            b = d & 0x7F
+        if 0 <= d < 0x80: return cls.varints[d]
+        if d < 0: d &= 0xFFFFFFFF
+        if d < 0x4000: return bytes((d & 0x7F | 0x80, d >> 7))
+        o = bytearray()
+        while d >= 0x80:
+            o.append(d & 0x7F | 0x80)
             d >>= 7
-            o += struct.pack('B', b | (0x80 if d > 0 else 0))
-            if d == 0: break
-        return o
+        o.append(d)
+        return bytes(o)
+class Compression(object):
+    def __init__(self, threshold=256, level=-1, skip_incompressible=True, offload_size=65536, max_size=2097152):
+        self.threshold = threshold
+        self.level = level
+        self.skip_incompressible = skip_incompressible
+        self.offload_size = offload_size
+        self.max_size = max_size
+        self.input_bytes, self.output_bytes = metrics.Counter(()), metrics.Counter(())
+    def encode(self, body):
+        # Returns (frame, bytes in, bytes out) and touches no shared state, so it can run on the thread pool
+        if len(body) >= self.threshold:
+            compressed = zlib.compress(body, self.level)
+            if not self.skip_incompressible or len(compressed) < len(body):
+                data = Buffer.pack_varint(len(body))
+                return Buffer.pack_varint(len(data) + len(compressed)) + data + compressed, len(body), len(compressed)
+            return Buffer.pack_varint(len(body) + 1) + b'\x00' + body, len(body), len(body)
+        return Buffer.pack_varint(len(body) + 1) + b'\x00' + body, 0, 0
+    def counted(self, result):
+        data, consumed, produced = result
+        if consumed:
+            self.input_bytes.value += consumed
+            self.output_bytes.value += produced
+        return data
+    def frame(self, body): return self.counted(self.encode(body))
+    def frame_later(self, body): return threads.deferToThread(self.encode, body).addCallback(self.counted)
+    def decompress(self, data):
+        buff = Buffer(data)
+        try: size = buff.unpack_varint()
+        except BufferUnderrun: raise ProtocolError('Empty compressed packet')
+        if size == 0: return data[buff.pos:]
+        if size > self.max_size: raise ProtocolError('Compressed packet too large: %d' % size)
+        decompressor = zlib.decompressobj()
+        try: body = decompressor.decompress(data[buff.pos:], size)
+        except zlib.error as e: raise ProtocolError('Bad compressed packet: %s' % e)
+        if len(body) != size or decompressor.unconsumed_tail: raise ProtocolError('Compressed packet size mismatch')
+        return body
+class PlayState(object):
+    __slots__ = ('x', 'y', 'z', 'yaw', 'pitch', 'on_ground', 'slot', 'entity_id', 'uuid', 'keep_alive_at', 'chat_message')
+    def __init__(self):
+        self.x, self.y, self.z, self.on_ground, self.slot = 1, 400, 0, True, 0
+        self.yaw, self.pitch = 0.0, 0.0
+        self.entity_id, self.uuid = 0, None
+        self.keep_alive_at = 0
+        self.chat_message = None
+    @staticmethod
+    def field(name):
+        # player.x and friends stay readable before login, the first write creates the state
+        def get(player): return getattr(player.play or PlayState.idle, name)
+        def set(player, value): setattr(player.get_play(), name, value)
+        return property(get, set)
+PlayState.idle = PlayState()
 class AuthProtocol(protocol.Protocol):
-    protocol_mode = 0
-    protocol_version = 0
+    # Protocol has no __slots__, so a __dict__ is still there for plugins but stays unallocated unless they use it
+    __slots__ = ('factory', 'transport', 'connected', 'client_addr', 'server_addr', 'server_port', 'protocol_mode', 'protocol_version',
+        'dispatch', 'encoders', 'compression', 'cipher', 'decipher', 'verify_token', 'buff', '_tasks', 'output', 'pending_writes', 'close_pending', 'pending', 'deadline',
+        'username', 'joined', 'play', 'connected_at', 'packets_in', 'bytes_in', 'bytes_out', 'writes')
     login_step = 0
+    x, y, z, yaw, pitch, on_ground, slot, entity_id, uuid, keep_alive_at, chat_message = [PlayState.field(name) for name in PlayState.__slots__]
+    modes = ('init', 'status', 'login', 'play')
+    handlers = {
+        ('init', 'handshake'): 'handle_handshake',
+        ('status', 'status_request'): 'handle_status_request',
+        ('status', 'status_ping'): 'handle_status_ping',
+        ('login', 'login_start'): 'handle_login_start',
+        ('login', 'login_encryption_response'): 'handle_encryption_response',
+        ('play', 'player_position'): 'handle_player_position',
+        ('play', 'player_position_and_look'): 'handle_player_position_and_look',
+        ('play', 'player_look'): 'handle_player_look',
+        ('play', 'held_item_change'): 'handle_held_item_change',
+        ('play', 'chat_message'): 'handle_chat_message',
+        ('play', 'keep_alive'): 'handle_keep_alive',
+    }
     def __init__(self, factory, addr):
-        self.x, self.y, self.z, self.on_ground, self.slot = 1, 400, 0, True, 0
-        self.username = 'NONE'
-        self.joined = False
         self.factory = factory
+        self.transport = None
+        self.connected = 0
         self.client_addr = addr.host
-        self.buff = Buffer()
-        self.tasks = Tasks()
-        self.cipher = lambda d: d
+        self.server_addr = self.server_port = None
+        self.protocol_mode = self.protocol_version = 0
+        self.dispatch = self.encoders = self.compression = self.cipher = self.decipher = self.verify_token = None
+        self.buff = self._tasks = self.output = self.pending_writes = self.deadline = self.play = None
+        self.close_pending = self.pending = self.joined = False
+        self.username = 'NONE'
+        self.connected_at = reactor.seconds()
+        self.packets_in = self.bytes_in = self.bytes_out = self.writes = 0
+    def get_play(self):
+        play = self.play
+        if play is None: play = self.play = PlayState()
+        return play
+    @property
+    def tasks(self):
+        tasks = self._tasks
+        if tasks is None: tasks = self._tasks = Tasks(self.factory.timers)
+        return tasks
+    def connectionMade(self):
+        self.factory.connections.add(self)
+        if self.factory.handshake_timeout > 0: self.deadline = self.factory.timers.call_later(self.factory.handshake_timeout, self.expire)
+    def expire(self):
+        self.factory.timeouts[self.get_mode()].value += 1
+        if self.get_mode() == 'login': self.kick('Login timed out')
+        else: self.close()
+    def admitted(self):
+        if self.deadline is not None: self.deadline.stop()
+        if self.pending:
+            self.pending = False
+            self.factory.admission.release()
     def dataReceived(self, data):
-        self.buff.add(data)
+        self.bytes_in += len(data)
+        if self.decipher is not None: data = self.decipher(data)
+        self.cork()
+        buff = self.buff
+        if buff is None: buff = self.buff = Buffer()
+        buff.add(data)
         while True:
             try:
-                packet_length = self.buff.unpack_varint()
-                packet_body = self.buff.unpack_raw(packet_length)
-                try: self.packet_received(packet_body)
+                packet_length = buff.unpack_varint()
+                packet_body = buff.unpack_raw(packet_length)
+                try:
+                    if self.compression is not None: packet_body = self.compression.decompress(packet_body)
+                    self.packet_received(packet_body)
                 except ProtocolError as e:
-                    self.factory.logging('Protocol Error: ', e)
+                    self.factory.protocol_errors.value += 1
+                    self.factory.logging('Protocol Error: %s' % e)
                     self.kick('Protocol Error!\n\n%s' % (e))
                     break
-                self.buff.save()
-            except BufferUnderrun: break
+                buff.save()
+            except BufferUnderrun:
+                buff.restore()
+                break
     def packet_received(self, data):
-        buff = Buffer()
-        buff.add(data)
+        if not data: raise ProtocolError('Empty packet')
+        buff = Buffer(data)
+        try: ident = buff.unpack_varint()
+        except BufferUnderrun: raise ProtocolError('Truncated packet ID')
+        if self.factory.debug: print(str(ident))
+        dispatch = self.dispatch
+        if dispatch is None: dispatch = self.dispatch = self.factory.get_dispatch(self.protocol_version, self.protocol_mode)
+        try: name, handlers, counter = dispatch[ident]
+        except KeyError:
+            if self.protocol_mode == 3: raise ProtocolError('No name known for packet: %s' % ((self.protocol_version, self.get_mode(), 'upstream', ident),))
+            raise ProtocolError.mode_mismatch(ident, self.protocol_mode)
+        counter.value += 1
+        self.packets_in += 1
+        if self.protocol_mode == 3:
+            if 'packet_recived' in self.factory.plugin_system.handlers: self.plugin_event('packet_recived', ident, name)
+            if self.factory.debug: print(str(name))
+        if not handlers: return
+        start = buff.pos
         try:
-            ident = buff.unpack_varint()
-            if self.factory.debug: print(str(ident))
-            if self.protocol_mode == 3:
-                key = (self.protocol_version, self.get_mode(), 'upstream', ident)
-                try: name = packets.packet_names[key]
-                except KeyError: raise ProtocolError('No name known for packet: %s' % (key,))
-                self.plugin_event('packet_recived', ident, name)
-                if self.factory.debug: print(str(name))
-                if name == 'player_position':
-                    self.x, self.y, self.z, self.o = buff.unpack('ddd?')
-                    self.plugin_event('player_move', self.x, self.y, self.z, self.on_ground)
-                if name == 'held_item_change': self.s = buff.unpack('h')
-                if name == 'chat_message':
-                    self.chat_message = buff.unpack_string()
-                    self.plugin_event('chat_message', self.chat_message)
-                    if self.chat_message[0] == '/': self.handle_command(self.chat_message[1:])
-                    else: self.send_chat_all('<%s> %s' % (self.username, self.chat_message))
-            if self.protocol_mode == 0:
-                if ident == 0:
-                    self.protocol_version = buff.unpack_varint()
-                    self.server_addr = buff.unpack_string()
-                    self.server_port = buff.unpack('H')
-                    self.protocol_mode = buff.unpack_varint()
-                else: raise ProtocolError.mode_mismatch(ident, self.protocol_mode)
-            elif self.protocol_mode == 1:
-                if ident == 0: self.send_packet('status_response', self.buff.pack_string(json.dumps(self.factory.get_status(self.protocol_version))))
-                elif ident == 1:
-                    time = buff.unpack('Q')
-                    self.send_packet('status_pong', self.buff.pack('Q', time))
-                    if self.factory.print_ping:
-                        self.factory.logging(self.client_addr + ' pinged')
-                    self.close()
-                else: raise ProtocolError.mode_mismatch(ident, self.protocol_mode)
-            elif self.protocol_mode == 2:
-                self.username = buff.unpack_string()
-                if not self.joined:
-                    self.joined = True
-                    self.send_packet('login_success', buff.pack_string('19e34a23-53d5-4bc2-a649-c9575ef08bb6') + buff.pack_string(self.username))
-                    self.protocol_mode = 3
-                    self.factory.players.add(self)
-                    self.send_chat_all('§e%s joined on server!' % (self.username))
-                    self.factory.logging('%s joined on server with parms:   %s|[%s]%s' % (self.username, self.protocol_version, self.client_addr, self.get_mode()))
-                    if self.protocol_version == 47:
-                        self.send_packet('join_game', buff.pack('iBbBB', 0, 0, 0, 0, 0) + buff.pack_string('flat') + buff.pack('?', False))
-                        self.send_packet('player_position_and_look', buff.pack('dddffb', float(0), float(400), float(0), float(-90), float(0), 0b00000))
-                    elif self.protocol_version == 107:
-                        self.send_packet('join_game', buff.pack('iBbBB', 0, 0, 0, 0, 0) + buff.pack_string('flat') + buff.pack('?', False))
-                        self.send_packet('player_position_and_look', buff.pack('dddffb', float(0), float(400), float(0), float(-90), float(0), True) + buff.pack_varint(0))
-                    else:
-                        self.send_packet('join_game', buff.pack('iBiBB', 0, 0, 0, 0, 0) + buff.pack_string('flat') + buff.pack('?', False))
-                        self.send_packet('player_position_and_look', buff.pack('dddff?', float(0), float(400), float(0), float(-90), float(0), True) + buff.pack_varint(0))
-                    self.send_chunk()
-                    self.plugin_event('player_join')
-                    self.tasks.add_loop(5, self.send_keep_alive)
-            else: raise ProtocolError.mode_mismatch(ident, self.protocol_mode)
-        except: pass
+            for handler in handlers:
+                buff.pos = start
+                handler(self, buff)
+        except BufferUnderrun: raise ProtocolError('Packet too short: %s' % name)
+        except (ValueError, struct.error) as e: raise ProtocolError('Malformed packet: %s (%s)' % (name, e))
+    def set_mode(self, mode):
+        self.protocol_mode = mode
+        self.dispatch = self.encoders = None
+    def handle_handshake(self, buff):
+        self.protocol_version = buff.unpack_varint()
+        self.server_addr = buff.unpack_string()
+        self.server_port = buff.unpack('H')
+        mode = buff.unpack_varint()
+        if mode not in (1, 2): raise ProtocolError('Unexpected next state in handshake: %s' % mode)
+        self.set_mode(mode)
+        if self.deadline is not None:
+            if self.factory.login_timeout > 0: self.deadline.reset(self.factory.login_timeout)
+            else: self.deadline.stop()
+    def handle_status_request(self, buff):
+        self.write(self.factory.get_status_packet(self))
+    def handle_status_ping(self, buff):
+        time = buff.unpack('Q')
+        # 1.7 names the downstream pong status_ping as well
+        pong = 'status_pong' if ('status', 'downstream', 'status_pong') in packets.get_table(self.protocol_version).idents else 'status_ping'
+        self.send_packet(pong, Buffer.pack('Q', time))
+        if self.factory.print_ping:
+            self.factory.logging(self.client_addr + ' pinged')
+        self.close()
+    def handle_login_start(self, buff):
+        self.username = buff.unpack_string()
+        if self.joined: return
+        if self.protocol_version not in packets.minecraft_versions: raise ProtocolError('Unsupported protocol version: %s' % self.protocol_version)
+        self.joined = True
+        if self.factory.player_count() >= self.factory.max_players:
+            self.factory.logins_refused.value += 1
+            self.write(self.factory.get_full_packet(self))
+            self.close()
+            return
+        if self.factory.encryption is not None:
+            self.verify_token = self.factory.encryption.token()
+            self.send_packet('login_encryption_request', Buffer.pack_string('') + self.pack_login_array(self.factory.encryption.public_key) + self.pack_login_array(self.verify_token))
+            return
+        self.finish_login()
+    def handle_encryption_response(self, buff):
+        if self.verify_token is None: raise ProtocolError('Unexpected encryption response')
+        if self.protocol_version < 47: secret, token = buff.unpack_array(), buff.unpack_array()
+        else: secret, token = buff.unpack_raw(buff.unpack_varint()), buff.unpack_raw(buff.unpack_varint())
+        try: secret, token = self.factory.encryption.decrypt(secret), self.factory.encryption.decrypt(token)
+        except ValueError: raise ProtocolError('Undecryptable encryption response')
+        if token != self.verify_token: raise ProtocolError('Verify token mismatch')
+        if len(secret) != 16: raise ProtocolError('Shared secret must be 16 bytes, got %d' % len(secret))
+        self.verify_token = None
+        self.enable_encryption(secret)
+        self.finish_login()
+    def enable_encryption(self, secret):
+        # Everything written so far goes out in plaintext, bytes already buffered behind this packet are ciphertext
+        self.flush()
+        self.cork()
+        encryptor, decryptor = encryption.Encryption.ciphers(secret)
+        self.cipher, self.decipher = encryptor.update, decryptor.update
+        buff = self.buff
+        if buff is not None and buff.pos < len(buff.buff1): buff.buff1[buff.pos:] = self.decipher(bytes(buff.buff1[buff.pos:]))
+    def pack_login_array(self, data):
+        if self.protocol_version < 47: return Buffer.pack_array(data)
+        return Buffer.pack_varint(len(data)) + data
+    def finish_login(self):
+        if self.factory.compression is not None and ('login', 'downstream', 'login_set_compression') in packets.get_table(self.protocol_version).idents:
+            self.send_packet('login_set_compression', Buffer.pack_varint(self.factory.compression.threshold))
+            self.compression = self.factory.compression
+        play = self.get_play()
+        play.uuid = uuid.UUID(bytes=hashlib.md5(('OfflinePlayer:' + self.username).encode('utf-8')).digest(), version=3)
+        play.entity_id = self.factory.next_entity_id()
+        self.send_packet('login_success', Buffer.pack_string(str(play.uuid)) + Buffer.pack_string(self.username))
+        self.set_mode(3)
+        self.admitted()
+        self.factory.add_player(self)
+        self.send_chat_all('§e%s joined on server!' % (self.username))
+        self.factory.logging('%s joined on server with parms:   %s|[%s]%s' % (self.username, self.protocol_version, self.client_addr, self.get_mode()))
+        self.write(self.factory.get_login_packets(self))
+        self.send_chunks()
+        self.factory.add_entity(self)
+        self.plugin_event('player_join')
+        play.keep_alive_at = reactor.seconds()
+    def handle_player_position(self, buff):
+        play = self.get_play()
+        play.x, play.y, play.z, play.on_ground = buff.unpack('ddd?')
+        self.factory.interest.moved_player(self)
+        self.plugin_event('player_move', play.x, play.y, play.z, play.on_ground)
+    def handle_player_position_and_look(self, buff):
+        play = self.get_play()
+        play.x, play.y, play.z, play.yaw, play.pitch, play.on_ground = buff.unpack('dddff?')
+        self.factory.interest.moved_player(self)
+        self.plugin_event('player_move', play.x, play.y, play.z, play.on_ground)
+    def handle_player_look(self, buff):
+        play = self.get_play()
+        play.yaw, play.pitch, play.on_ground = buff.unpack('ff?')
+        self.factory.interest.moved_player(self)
+    def handle_keep_alive(self, buff): self.get_play().keep_alive_at = reactor.seconds()
+    def handle_held_item_change(self, buff): self.get_play().slot = buff.unpack('h')
+    def handle_chat_message(self, buff):
+        message = self.get_play().chat_message = buff.unpack_string()
+        self.plugin_event('chat_message', message)
+        if message.startswith('/'): self.handle_command(message[1:])
+        else: self.send_chat_all('<%s> %s' % (self.username, message))
+    def packet_body(self, name, data):
+        encoders = self.encoders
+        if encoders is None: encoders = self.encoders = self.factory.get_encoders(self.protocol_version, self.protocol_mode)
+        try: prefix, counter = encoders[name]
+        except KeyError: raise ProtocolError('No ID known for packet: %s' % ((self.protocol_version, self.get_mode(), 'downstream', name),))
+        counter.value += 1
+        return prefix + data
+    def encode_packet(self, name, data):
+        data = self.packet_body(name, data)
+        if self.compression is not None: return self.compression.frame(data)
+        return Buffer.pack_varint(len(data)) + data
     def send_packet(self, name, data):
-        key = (self.protocol_version, self.get_mode(), 'downstream', name)
-        try: ident = packets.packet_idents[key]
-        except KeyError: raise ProtocolError('No ID known for packet: %s' % (key,))
-        data = Buffer.pack_varint(ident) + data
-        data = Buffer.pack_varint(len(data)) + data
-        if len(data) >= 256: data = Buffer.pack_varint(len(data)) + zlib.compress(data)
-        else: data = Buffer.pack_varint(0) + data
-        data = self.cipher(data)
-        self.transport.write(data)
-    def close(self):
+        compression = self.compression
+        if compression is None or len(data) < compression.offload_size: self.write(self.encode_packet(name, data))
+        else: self.write_later(compression.frame_later(self.packet_body(name, data)))
+    def write(self, packet):
+        if self.pending_writes is not None: self.pending_writes.append([packet])
+        elif self.output is not None: self.output.append(packet)
+        else: self.transport_write(packet)
+    def transport_write(self, data):
+        self.bytes_out += len(data)
+        self.writes += 1
+        self.factory.write_sizes.observe(len(data))
+        cipher = self.cipher
+        self.transport.write(data if cipher is None else cipher(data))
+    def cork(self):
+        if self.output is None:
+            self.output = []
+            self.factory.cork(self)
+    def flush(self):
+        output = self.output
+        if output is None: return
+        self.output = None
+        if output: self.transport_write(output[0] if len(output) == 1 else b''.join(output))
+    def write_later(self, deferred): self.factory.write_later((self,), deferred)
+    def hold_write(self):
+        # Keeps the place of a packet that is still being compressed, later writes queue behind it
+        self.flush()
+        if self.pending_writes is None: self.pending_writes = collections.deque()
+        cell = [None]
+        self.pending_writes.append(cell)
+        return cell
+    def release_write(self, cell, packet):
+        cell[0] = packet
+        self.drain_writes()
+    def write_failed(self, failure):
+        self.factory.logging('Packet compression failed: %s' % failure.getErrorMessage())
+        self.pending_writes = None
         self.transport.loseConnection()
+    def drain_writes(self):
+        pending = self.pending_writes
+        while pending and pending[0][0] is not None: self.transport_write(pending.popleft()[0])
+        if pending is not None and not pending:
+            self.pending_writes = None
+            if self.close_pending: self.transport.loseConnection()
+    def send_packet_all(self, name, data):
+        self.factory.broadcast(name, data)
+    def close(self):
+        self.flush()
+        if self.pending_writes is None: self.transport.loseConnection()
+        else: self.close_pending = True
     def connectionLost(self, reason=None):
-        self.tasks.stop_all()
-        if self.get_mode() in ('login', 'play'):
-            self.factory.players.discard(self)
+        if self._tasks is not None: self._tasks.stop_all()
+        self.factory.connection_closed(self)
+        self.admitted()
+        if self in self.factory.players:
+            self.factory.remove_player(self)
             self.plugin_event('player_leave')
             self.send_chat_all('§e%s leaved from server!' % (self.username))
             self.factory.logging('%s leaved from server with parms: %s|[%s]%s' % (self.username, self.protocol_version, self.client_addr, self.get_mode()))
     def kick(self, message):
-        if self.get_mode() == 'login': self.send_packet('login_disconnect', self.buff.pack_chat(message.replace('&', u'\u00A7')))
-        else: self.send_packet('disconnect', self.buff.pack_chat(message.replace('&', u'\u00A7')))
+        try:
+            if self.get_mode() == 'login': self.send_packet('login_disconnect', Buffer.pack_chat(message.replace('&', u'\u00A7')))
+            else: self.send_packet('disconnect', Buffer.pack_chat(message.replace('&', u'\u00A7')))
+        except ProtocolError: pass
         self.close()
     def send_title(self, message, sub, fadein, stay, fadeout):
-        self.send_packet('title', self.buff.pack_varint(0) + self.buff.pack_chat(message))
-        self.send_packet('title', self.buff.pack_varint(1) + self.buff.pack_chat(sub))
-        if self.protocol_version <= 210: self.send_packet('title', self.buff.pack_varint(2) + self.buff.pack('iii', fadein, stay, fadeout))
-        else: self.send_packet('title', self.buff.pack_varint(3) + self.buff.pack('iii', fadein, stay, fadeout))
-    def send_chunk(self):
-        if self.protocol_version == 47: self.send_packet('chunk_data', self.buff.pack('ii?H', 0, 0, True, 0) + self.buff.pack_varint(0))
-        elif self.protocol_version == 109 or self.protocol_version == 108 or self.protocol_version == 107: self.send_packet('chunk_data', self.buff.pack('ii?', 0, 0, True) + self.buff.pack_varint(0) + self.buff.pack_varint(0))
-        else: self.send_packet('chunk_data', self.buff.pack('ii?H', 0, 0, True, 0) + self.buff.pack_varint(0))
+        self.send_packet('title', Buffer.pack_varint(0) + Buffer.pack_chat(message))
+        self.send_packet('title', Buffer.pack_varint(1) + Buffer.pack_chat(sub))
+        if self.protocol_version <= 210: self.send_packet('title', Buffer.pack_varint(2) + Buffer.pack('iii', fadein, stay, fadeout))
+        else: self.send_packet('title', Buffer.pack_varint(3) + Buffer.pack('iii', fadein, stay, fadeout))
+    def encode_login_packets(self):
+        buff = Buffer
+        if self.protocol_version == 47:
+            data = self.encode_packet('join_game', buff.pack('iBbBB', 0, 0, 0, 0, 0) + buff.pack_string('flat') + buff.pack('?', False))
+            data += self.encode_packet('player_position_and_look', buff.pack('dddffb', float(0), float(400), float(0), float(-90), float(0), 0b00000))
+        elif self.protocol_version == 107:
+            data = self.encode_packet('join_game', buff.pack('iBbBB', 0, 0, 0, 0, 0) + buff.pack_string('flat') + buff.pack('?', False))
+            data += self.encode_packet('player_position_and_look', buff.pack('dddffb', float(0), float(400), float(0), float(-90), float(0), True) + buff.pack_varint(0))
+        else:
+            data = self.encode_packet('join_game', buff.pack('iBiBB', 0, 0, 0, 0, 0) + buff.pack_string('flat') + buff.pack('?', False))
+            data += self.encode_packet('player_position_and_look', buff.pack('dddff?', float(0), float(400), float(0), float(-90), float(0), True) + buff.pack_varint(0))
+        return data
+    def chunk_data(self, chunk):
+        mask, data = chunk.column(self.protocol_version)
+        if self.protocol_version < 47:
+            data = zlib.compress(data)
+            return Buffer.pack('ii?HHi', chunk.x, chunk.z, True, mask, 0, len(data)) + data
+        elif self.protocol_version == 47: return Buffer.pack('ii?H', chunk.x, chunk.z, True, mask) + Buffer.pack_varint(len(data)) + data
+        elif self.protocol_version < 110: return Buffer.pack('ii?', chunk.x, chunk.z, True) + Buffer.pack_varint(mask) + Buffer.pack_varint(len(data)) + data
+        else: return Buffer.pack('ii?', chunk.x, chunk.z, True) + Buffer.pack_varint(mask) + Buffer.pack_varint(len(data)) + data + Buffer.pack_varint(0)
+    def send_chunk(self, chunk_x=0, chunk_z=0): self.factory.write_chunk(self, chunk_x, chunk_z)
+    def send_chunks(self):
+        play = self.play or PlayState.idle
+        chunk_x, chunk_z = int(math.floor(play.x)) >> 4, int(math.floor(play.z)) >> 4
+        radius = self.factory.view_distance
+        for x in range(chunk_x - radius, chunk_x + radius + 1):
+            for z in range(chunk_z - radius, chunk_z + radius + 1): self.send_chunk(x, z)
     def send_spawn_player(self, entity_id, player_uuid, x, y, z, yaw, pitch):
-        self.send_packet("spawn_player", self.buff.pack_varint(entity_id) + self.buff.pack_uuid(player_uuid) + self.buff_type.pack('dddbbBdb', x, y, z, yaw, pitch, 0, 7, 20))
+        angles = Buffer.pack('BB', int(yaw * 256 / 360) & 0xFF, int(pitch * 256 / 360) & 0xFF)
+        if self.protocol_version == 47: data = Buffer.pack('iii', int(math.floor(x * 32)), int(math.floor(y * 32)), int(math.floor(z * 32))) + angles + Buffer.pack('hBfB', 0, 0x66, 20.0, 0x7F)
+        else: data = Buffer.pack('ddd', x, y, z) + angles + b'\xff'
+        self.send_packet('spawn_player', Buffer.pack_varint(entity_id) + Buffer.pack_uuid(player_uuid) + data)
+    def send_spawn_entity(self, player):
+        play = player.play
+        self.send_spawn_player(play.entity_id, play.uuid, play.x, play.y, play.z, play.yaw, play.pitch)
+    def send_destroy_entities(self, entity_ids):
+        self.send_packet('destroy_entities', Buffer.pack_varint(len(entity_ids)) + b''.join(Buffer.pack_varint(entity_id) for entity_id in entity_ids))
+    def encode_entity_move(self, player, old, new):
+        play = player.play
+        angles = Buffer.pack('BB?', int(play.yaw * 256 / 360) & 0xFF, int(play.pitch * 256 / 360) & 0xFF, play.on_ground)
+        if self.protocol_version == 47:
+            delta = [b - a for a, b in zip(old[0], new[0])]
+            if -128 <= min(delta) and max(delta) <= 127: return self.encode_packet('entity_look_and_relative_move', Buffer.pack_varint(play.entity_id) + Buffer.pack('bbb', *delta) + angles)
+            return self.encode_packet('entity_teleport', Buffer.pack_varint(play.entity_id) + Buffer.pack('iii', *new[0]) + angles)
+        delta = [b - a for a, b in zip(old[1], new[1])]
+        if -32768 <= min(delta) and max(delta) <= 32767: return self.encode_packet('entity_look_and_relative_move', Buffer.pack_varint(play.entity_id) + Buffer.pack('hhh', *delta) + angles)
+        return self.encode_packet('entity_teleport', Buffer.pack_varint(play.entity_id) + Buffer.pack('ddd', play.x, play.y, play.z) + angles)
+    def send_player_list(self, action, players):
+        data = Buffer.pack_varint(action) + Buffer.pack_varint(len(players))
+        if action == 0: data += b''.join(Buffer.pack_uuid(player.uuid) + Buffer.pack_string(player.username) + b'\x00\x00\x00\x00' for player in players)
+        else: data += b''.join(Buffer.pack_uuid(player.uuid) for player in players)
+        self.send_packet('player_list_item', data)
     def send_held_item_change(self, slot):
-        self.send_packet('held_item_change', self.buff.pack('b', slot))
+        self.send_packet('held_item_change', Buffer.pack('b', slot))
     def send_update_health(self, heal, food):
-        self.send_packet('update_health', self.buff.pack('f', heal) + self.buff.pack_varint(food) + self.buff.pack('f', 0.0))
+        self.send_packet('update_health', Buffer.pack('f', heal) + Buffer.pack_varint(food) + Buffer.pack('f', 0.0))
     def send_set_experience(self, exp, lvl):
-        self.send_packet('set_experience', self.buff.pack('f', exp) + self.buff.pack_varint(lvl) + self.buff.pack_varint(0))
+        self.send_packet('set_experience', Buffer.pack('f', exp) + Buffer.pack_varint(lvl) + Buffer.pack_varint(0))
     def send_chat(self, msg):
-        self.send_packet('chat_message', self.buff.pack_chat(msg) + self.buff.pack('b', 0))
+        self.send_packet('chat_message', Buffer.pack_chat(msg) + Buffer.pack('b', 0))
     def send_chat_all(self, msg):
-        for player in self.factory.players:
-            player.send_packet('chat_message', self.buff.pack_chat(msg) + self.buff.pack('b', 0))
+        self.factory.broadcast('chat_message', Buffer.pack_chat(msg) + Buffer.pack('b', 0))
     def send_player_list_header_footer(self, up, down):
-        self.send_packet('player_list_header_footer', self.buff.pack_chat(up) + self.buff.pack_chat(down))
+        self.send_packet('player_list_header_footer', Buffer.pack_chat(up) + Buffer.pack_chat(down))
     def send_set_slot(self, id, count, slot, window=0):
-        self.send_packet('set_slot', self.buff.pack('bh', window, slot) + self.buff.pack_slot(id, count, 0, None))
+        self.send_packet('set_slot', Buffer.pack('bh', window, slot) + Buffer.pack_slot(id, count, 0, None))
+    def keep_alive_payload(self, ident=0):
+        if self.protocol_version <= 338: return Buffer.pack_varint(ident)
+        return Buffer.pack('Q', ident)
     def send_keep_alive(self):
-        if self.protocol_version <= 338: payload = self.buff.pack_varint(0)
-        else: payload = self.buff.pack('Q', 0)
-        self.send_packet('keep_alive', payload)
+        self.send_packet('keep_alive', self.keep_alive_payload())
     def set_position(self, x, y, z):
-        self.send_packet('player_position_and_look', self.buff.pack('dddff?', float(x), float(y), float(z), float(-90), float(0), True))
+        self.send_packet('player_position_and_look', Buffer.pack('dddff?', float(x), float(y), float(z), float(-90), float(0), True))
     def kick_all(self, msg):
-        for player in self.factory.players:
-            player.kick(msg)
+        self.factory.kick_all(msg)
     def handle_command(self, command_string):
         self.factory.logging('Player ' + self.username + ' issued server command: /' + command_string + '')
         command_list = command_string.split(' ')
         command, arguments = command_list[0], command_string.split(' ')[1:]
         self.plugin_event('player_command', command, arguments)
     def get_mode(self):
-        if self.protocol_mode == 0: mm = 'init'
-        elif self.protocol_mode == 1: mm = 'status'
-        elif self.protocol_mode == 2: mm = 'login'
-        elif self.protocol_mode == 3: mm = 'play'
-        else: mm = 'unknown'
-        return mm
+        if 0 <= self.protocol_mode < 4: return self.modes[self.protocol_mode]
+        return 'unknown'
+    def stats(self):
+        return {'username': self.username, 'address': self.client_addr, 'mode': self.get_mode(), 'protocol_version': self.protocol_version,
+            'connected': reactor.seconds() - self.connected_at, 'packets_in': self.packets_in, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+            'writes': self.writes, 'compression': self.compression is not None, 'encrypted': self.cipher is not None}
     def plugin_event(self, event_name, *args, **kwargs):
         self.factory.plugin_system.call_event(event_name, self, *args, **kwargs)
-    def stop(self):
-        for player in self.factory.players:
-            player.kick('Server stopped')
-        reactor.removeAll()
-        reactor.iterate()
-        reactor.stop()
+    def stop(self): self.factory.stop()
 class AuthServer(protocol.Factory):
-    def __init__(self):
+    protocol = AuthProtocol
+    def __init__(self, worker=None):
         self.config = configparser.RawConfigParser()
         self.config.read('server.properties')
-        self.plugin_system = PluginSystem(folder=abspath('plugins'))
+        self.plugin_system = PluginSystem(folder=abspath('plugins'),
+            slow_threshold=float(self.config.get('server', 'plugin-slow-threshold', fallback='0.05')),
+            threads=int(self.config.get('server', 'plugin-threads', fallback='4')))
         self.plugin_system.register_events()
         self.players = set()
+        self.remote_players = {}
+        self.worker = worker
+        self.cluster = None
+        self.stopping = False
+        self.dispatch = {}
+        self.keep_alive_id = 0
+        self.corked = set()
+        self.connections = set()
+        self.closed_totals = {'bytes_in': 0, 'bytes_out': 0, 'writes': 0}
+        self.encoders = {}
         self.s_port = int(self.config.get('server', 'server-port'))
         self.s_host = self.config.get('server', 'server-ip')
         self.print_ping = self.str2bool(self.config.get('server', 'print-ping'))
         self.max_players = int(self.config.get('server', 'max-players'))
         self.debug = self.str2bool(self.config.get('server', 'debug'))
         self.motd = self.config.get('server', 'motd')
-        self.status = {'description': self.motd.replace('&', u'\u00A7'),'players': {'max': self.max_players, 'online': len(self.players)},'version': {'name': '', 'protocol': 0}}
-    def run(self):
-        reactor.listenTCP(self.s_port, self, interface=self.s_host)
+        threshold = int(self.config.get('server', 'compression-threshold', fallback='256'))
+        self.compression = Compression(
+            threshold=threshold,
+            level=int(self.config.get('server', 'compression-level', fallback='-1')),
+            skip_incompressible=self.str2bool(self.config.get('server', 'compression-skip-incompressible', fallback='true')),
+            offload_size=int(self.config.get('server', 'compression-offload-size', fallback='65536'))) if threshold >= 0 else None
+        self.encryption = encryption.Encryption(bits=int(self.config.get('server', 'encryption-key-bits', fallback='1024'))) if self.str2bool(self.config.get('server', 'encryption', fallback='false')) else None
+        # Workers rotate on their own, so each one writes its own file next to the master's
+        log_file = self.config.get('server', 'log-file', fallback='logger.log')
+        self.log_writer = self.open_log(self.config, log_file if worker is None else '%s.worker%d' % (log_file, worker))
+        self.keep_alive_interval = float(self.config.get('server', 'keep-alive-interval', fallback='5'))
+        self.keep_alive_timeout = float(self.config.get('server', 'keep-alive-timeout', fallback='30'))
+        self.timers = TimerWheel(tick=float(self.config.get('server', 'timer-tick', fallback='0.05')))
+        self.timers.log = self.logging
+        self.timers.call_every(self.keep_alive_interval, self.keep_alive_sweep)
+        self.admission = admission.Admission(reactor,
+            rate=float(self.config.get('server', 'rate-limit-ip', fallback='2')),
+            burst=int(self.config.get('server', 'rate-limit-ip-burst', fallback='10')),
+            subnet_rate=float(self.config.get('server', 'rate-limit-subnet', fallback='20')),
+            subnet_burst=int(self.config.get('server', 'rate-limit-subnet-burst', fallback='50')),
+            max_pending=int(self.config.get('server', 'max-pending-connections', fallback='256')),
+            exempt=[host.strip() for host in self.config.get('server', 'rate-limit-exempt', fallback='127.0.0.1,::1').split(',') if host.strip()])
+        self.timers.call_every(60, self.admission.prune)
+        self.handshake_timeout = float(self.config.get('server', 'handshake-timeout', fallback='5'))
+        self.login_timeout = float(self.config.get('server', 'login-timeout', fallback='15'))
+        self.full_message = self.config.get('server', 'server-full-message', fallback='Server is full!')
+        self.full_packets = {}
+        self.entity_id = 0
+        self.interest = interest.Interest(radius=int(self.config.get('server', 'entity-view-distance', fallback='3')))
+        self.timers.call_every(float(self.config.get('server', 'entity-tick', fallback='0.05')), self.interest.tick)
+        self.plugin_system.log = self.logging
+        self.plugin_system.call_in_main = reactor.callFromThread
+        self.status_state = None
+        self.status_packets = {}
+        self.login_packets = {}
+        self.world = chunks.World(abspath(self.config.get('server', 'world', fallback='world')))
+        self.view_distance = int(self.config.get('server', 'view-distance', fallback='4'))
+        self.chunk_cache_size = int(self.config.get('server', 'chunk-cache-size', fallback='2048'))
+        self.chunk_packets = collections.OrderedDict()
+        self.chunk_waiting = {}
+        self.metrics_port = int(self.config.get('server', 'metrics-port', fallback='-1'))
+        self.metrics_host = self.config.get('server', 'metrics-ip', fallback='127.0.0.1')
+        self.metrics_interval = float(self.config.get('server', 'metrics-interval', fallback='10'))
+        self.metrics = metrics.Registry()
+        self.protocol_errors = self.metrics.counter('protocol_errors_total', 'Connections kicked for protocol errors')
+        self.write_sizes = self.metrics.histogram('transport_write_bytes', 'Bytes per transport write', (64, 256, 1024, 4096, 16384, 65536, 262144))
+        self.reactor_lag = self.metrics.histogram('reactor_lag_seconds', 'How late the reactor ran a 0.25 s timer', (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+        self.lag_expected = None
+        self.rejected = dict((reason, self.metrics.counter('connections_rejected_total', 'Connections refused before a protocol was built', reason=reason)) for reason in ('ip', 'subnet', 'pending'))
+        self.timeouts = dict((mode, self.metrics.counter('connections_timed_out_total', 'Connections closed by the handshake or login deadline', mode=mode)) for mode in AuthProtocol.modes + ('unknown',))
+        self.logins_refused = self.metrics.counter('logins_refused_total', 'Logins refused because the server was full')
+        self.metrics.collector('pending_connections', 'gauge', 'Admitted connections that have not reached play', lambda: [({}, self.admission.pending)])
+        if self.compression is not None:
+            self.compression.input_bytes = self.metrics.counter('compression_input_bytes_total', 'Bytes of packets at or above the compression threshold')
+            self.compression.output_bytes = self.metrics.counter('compression_output_bytes_total', 'Bytes those packets took on the wire')
+        self.metrics.collector('connections', 'gauge', 'Open connections by protocol mode', lambda: [({'mode': mode}, count) for mode, count in collections.Counter(conn.get_mode() for conn in self.connections).items()])
+        self.metrics.collector('players', 'gauge', 'Players on this server by protocol version', lambda: [({'protocol_version': pv, 'minecraft_version': packets.minecraft_versions.get(pv, '')}, count) for pv, count in collections.Counter(player.protocol_version for player in self.players).items()])
+        for key, name, help in (('bytes_in', 'bytes_received_total', 'Bytes received'), ('bytes_out', 'bytes_sent_total', 'Bytes written to transports'), ('writes', 'transport_writes_total', 'Transport writes')):
+            self.metrics.collector(name, 'counter', help, lambda key=key: [({}, self.closed_totals[key] + sum(getattr(conn, key) for conn in self.connections))])
+        for key, name, help in (('count', 'plugin_handler_calls_total', 'Plugin handler calls'), ('total', 'plugin_handler_seconds_total', 'Time spent in plugin handlers'), ('max', 'plugin_handler_max_seconds', 'Slowest plugin handler call'), ('p99', 'plugin_handler_p99_seconds', 'p99 of recent plugin handler calls'), ('dropped', 'plugin_handler_dropped_total', 'Blocking handler calls dropped')):
+            self.metrics.collector(name, 'gauge' if key in ('max', 'p99') else 'counter', help, lambda key=key: [({'event': stat['event'], 'handler': stat['handler']}, stat[key]) for stat in self.plugin_system.stats()])
+        self.metrics.collector('chunk_cache_packets', 'gauge', 'Framed chunk packets in the chunk cache', lambda: [({}, len(self.chunk_packets))])
+    def run(self, worker=None, cluster=None):
+        if cluster is None: reactor.listenTCP(self.s_port, self, interface=self.s_host)
+        else:
+            self.worker = worker
+            workers.listen_reuseport(self, self.s_port, self.s_host)
+            reactor.connectUNIX(cluster, workers.ClusterClientFactory(self))
+        reactor.addSystemEventTrigger('after', 'shutdown', self.log_writer.flush)
+        self.timers.start()
+        LoopingCall(self.sample_lag).start(0.25)
+        if self.metrics_interval > 0: LoopingCall(self.report_metrics).start(self.metrics_interval, now=False)
+        if self.metrics_port >= 0:
+            port = self.metrics_port + (worker or 0)
+            reactor.listenTCP(port, Site(metrics.MetricsResource(self.metrics, self.connection_stats)), interface=self.metrics_host)
+            self.logging('Metrics on http://%s:%s/metrics' % (self.metrics_host, port))
         self.logging('Server started on %s:%s' % (self.s_host, str(self.s_port)))
         reactor.run()
         self.logging('Done!')
-    def buildProtocol(self, addr): return AuthProtocol(self, addr)
+        self.plugin_system.close()
+        self.world.close()
+        self.log_writer.close()
+    def buildProtocol(self, addr):
+        reason = self.admission.admit(addr.host)
+        if reason is not None:
+            self.rejected[reason].value += 1
+            return None
+        player = AuthProtocol(self, addr)
+        player.pending = True
+        return player
+    def get_dispatch(self, protocol_version, protocol_mode):
+        key = (protocol_version, protocol_mode)
+        dispatch = self.dispatch.get(key)
+        if dispatch is not None: return dispatch
+        dispatch = self.dispatch[key] = {}
+        if not 0 <= protocol_mode < 4: return dispatch
+        mode = self.protocol.modes[protocol_mode]
+        if protocol_version not in packets.minecraft_versions:
+            if mode not in ('init', 'status'): return dispatch
+            protocol_version = packets.default_protocol_version
+        decoders = self.plugin_system.packets.get(mode, {})
+        for ident, name in enumerate(packets.get_table(protocol_version).names.get((mode, 'upstream'), ())):
+            handlers = tuple(decoders.get(name, ()))
+            method = self.protocol.handlers.get((mode, name))
+            if method is not None: handlers = (getattr(self.protocol, method),) + handlers
+            dispatch[ident] = (name, handlers, self.metrics.counter('packets_received_total', 'Packets received by name', mode=mode, packet=name))
+        return dispatch
+    def get_encoders(self, protocol_version, protocol_mode):
+        key = (protocol_version, protocol_mode)
+        encoders = self.encoders.get(key)
+        if encoders is not None: return encoders
+        encoders = self.encoders[key] = {}
+        if not 0 <= protocol_mode < 4: return encoders
+        mode = self.protocol.modes[protocol_mode]
+        if protocol_version not in packets.minecraft_versions:
+            if mode not in ('init', 'status'): return encoders
+            protocol_version = packets.default_protocol_version
+        for ident, name in enumerate(packets.get_table(protocol_version).names.get((mode, 'downstream'), ())):
+            encoders[name] = (Buffer.pack_varint(ident), self.metrics.counter('packets_encoded_total', 'Packets encoded by name; broadcasts and cached packets count once', mode=mode, packet=name))
+        return encoders
+    def add_packet_handler(self, name, handler, mode='play'):
+        self.plugin_system.add_packet(mode, name, handler)
+        self.dispatch.clear()
+        for player in tuple(self.players): player.dispatch = None
+    def cork(self, player):
+        if not self.corked: reactor.callLater(0, self.flush_corked)
+        self.corked.add(player)
+    def flush_corked(self):
+        corked, self.corked = self.corked, set()
+        for player in corked: player.flush()
+    def connection_closed(self, player):
+        if player not in self.connections: return
+        self.connections.discard(player)
+        for key in self.closed_totals: self.closed_totals[key] += getattr(player, key)
+    def connection_stats(self): return [conn.stats() for conn in self.connections]
+    def sample_lag(self):
+        now = reactor.seconds()
+        if self.lag_expected is not None: self.reactor_lag.observe(max(0.0, now - self.lag_expected))
+        self.lag_expected = now + 0.25
+    def report_metrics(self):
+        if self.plugin_system.has_event('server_metrics'): self.plugin_system.call_event('server_metrics', self, list(self.metrics.samples()))
+    def add_player(self, player):
+        self.players.add(player)
+        if self.cluster is not None: self.cluster.join(player.username)
+    def remove_player(self, player):
+        if player not in self.players: return
+        self.players.discard(player)
+        if self.cluster is not None: self.cluster.leave(player.username)
+        if player in self.interest.tracked:
+            self.interest.remove(player)
+            self.broadcast('player_list_item', Buffer.pack_varint(4) + Buffer.pack_varint(1) + Buffer.pack_uuid(player.uuid), list(self.interest.tracked))
+    def next_entity_id(self):
+        self.entity_id += 1
+        return self.entity_id
+    def add_entity(self, player):
+        # Entities and the tab list use the 1.8+ packet layouts, 1.7 clients are left out
+        if player.protocol_version < 47: return
+        others = list(self.interest.tracked)
+        self.broadcast('player_list_item', Buffer.pack_varint(0) + Buffer.pack_varint(1) + Buffer.pack_uuid(player.uuid) + Buffer.pack_string(player.username) + b'\x00\x00\x00\x00', others)
+        player.send_player_list(0, others + [player])
+        self.interest.add(player)
+    def player_count(self): return len(self.players) + sum(len(names) for names in self.remote_players.values())
+    def player_names(self): return [player.username for player in self.players] + [name for names in self.remote_players.values() for name in names]
+    def broadcast(self, name, data, players=None, relay=True):
+        if players is None and relay and self.cluster is not None: self.cluster.broadcast(name, data)
+        groups = {}
+        for player in tuple(self.players if players is None else players):
+            key = (player.protocol_version, player.protocol_mode, player.compression)
+            group = groups.get(key)
+            if group is None: groups[key] = [player]
+            else: group.append(player)
+        for (protocol_version, protocol_mode, compression), group in groups.items():
+            try:
+                if compression is not None and len(data) >= compression.offload_size:
+                    self.write_later(group, compression.frame_later(group[0].packet_body(name, data)))
+                    continue
+                packet = group[0].encode_packet(name, data)
+            except ProtocolError as e:
+                self.logging('Broadcast skipped: %s' % e)
+                continue
+            for player in group:
+                player.cork()
+                player.write(packet)
+    def write_later(self, players, deferred):
+        # Every player gets the packet in its place in their output once the thread pool has compressed it
+        held = [(player, player.hold_write()) for player in players]
+        def written(packet):
+            for player, cell in held: player.release_write(cell, packet)
+            return packet
+        def failed(failure):
+            for player, cell in held: player.write_failed(failure)
+        deferred.addCallbacks(written, failed)
+        return held
+    def keep_alive_sweep(self):
+        now = reactor.seconds()
+        self.keep_alive_id = (self.keep_alive_id + 1) & 0x7FFFFFFF
+        encoded = {}
+        for player in tuple(self.players):
+            if self.keep_alive_timeout > 0 and now - player.keep_alive_at > self.keep_alive_timeout:
+                self.logging('%s timed out' % player.username)
+                player.kick('Timed out')
+                continue
+            key = (player.protocol_version, player.compression)
+            packet = encoded.get(key)
+            if packet is None:
+                try: packet = player.encode_packet('keep_alive', player.keep_alive_payload(self.keep_alive_id))
+                except ProtocolError: packet = b''
+                encoded[key] = packet
+            if packet: player.write(packet)
+    def kick_all(self, message, relay=True):
+        if relay and self.cluster is not None: self.cluster.kick_all(message)
+        players = tuple(self.players)
+        self.broadcast('disconnect', Buffer.pack_chat(message.replace('&', u'\u00A7')), players)
+        for player in players: player.close()
+    def stop(self):
+        if self.cluster is not None: self.cluster.stop()
+        else: self.shutdown()
+    def shutdown(self):
+        if self.stopping: return
+        self.stopping = True
+        self.kick_all('Server stopped', relay=False)
+        self.plugin_system.close()
+        self.log_writer.flush()
+        reactor.removeAll()
+        reactor.iterate()
+        reactor.stop()
     def logging(self, message):
-        message = '%s | %s\n' % (datetime.datetime.now().strftime('[%H:%M:%S]'), message)
-        print(message)
-        with open('logger.log', 'a') as the_file: the_file.write(message)
+        if self.worker is not None: message = 'worker %d | %s' % (self.worker, message)
+        self.log_writer.write(self.log_writer.format(message))
     def get_status(self, protocol_version):
-        d = dict(self.status)
-        d['version']['protocol'] = protocol_version
-        return d
+        return {'description': self.motd.replace('&', u'\u00A7'), 'players': {'max': self.max_players, 'online': self.player_count()}, 'version': {'name': '', 'protocol': protocol_version}}
+    def get_status_packet(self, player):
+        state = (self.motd, self.max_players, self.player_count())
+        if state != self.status_state or len(self.status_packets) >= 64:
+            self.status_state = state
+            self.status_packets = {}
+        packet = self.status_packets.get(player.protocol_version)
+        if packet is None: packet = self.status_packets[player.protocol_version] = player.encode_packet('status_response', Buffer.pack_json(self.get_status(player.protocol_version)))
+        return packet
+    def get_full_packet(self, player):
+        packet = self.full_packets.get(player.protocol_version)
+        if packet is None: packet = self.full_packets[player.protocol_version] = player.encode_packet('login_disconnect', Buffer.pack_chat(self.full_message.replace('&', u'\u00A7')))
+        return packet
+    def get_login_packets(self, player):
+        key = (player.protocol_version, player.compression)
+        packet = self.login_packets.get(key)
+        if packet is None: packet = self.login_packets[key] = player.encode_login_packets()
+        return packet
+    def cache_chunk(self, key, packet):
+        self.chunk_packets[key] = packet
+        if len(self.chunk_packets) > self.chunk_cache_size: self.chunk_packets.popitem(last=False)
+        return packet
+    def write_chunk(self, player, chunk_x, chunk_z):
+        # A cold chunk big enough for the thread pool is compressed once for everyone who asks while it is in flight
+        key = (chunk_x, chunk_z, player.protocol_version)
+        packet = self.chunk_packets.get(key)
+        if packet is not None: self.chunk_packets.move_to_end(key)
+        else:
+            waiting = self.chunk_waiting.get(key)
+            if waiting is not None: return waiting.append((player, player.hold_write()))
+            data = player.chunk_data(self.world.get_chunk(chunk_x, chunk_z))
+            compression = player.compression
+            if compression is not None and len(data) >= compression.offload_size:
+                deferred = compression.frame_later(player.packet_body('chunk_data', data))
+                self.chunk_waiting[key] = self.write_later((player,), deferred)
+                deferred.addCallback(self.chunk_written, key)
+                return
+            packet = self.cache_chunk(key, player.encode_packet('chunk_data', data))
+        player.write(packet)
+    def chunk_written(self, packet, key):
+        del self.chunk_waiting[key]
+        if packet is not None: self.cache_chunk(key, packet)
+    @staticmethod
+    def open_log(config, path):
+        return LogWriter(
+            path=path,
+            queue_size=int(config.get('server', 'log-queue-size', fallback='10000')),
+            flush_interval=float(config.get('server', 'log-flush-interval', fallback='0.5')),
+            max_bytes=int(config.get('server', 'log-max-bytes', fallback='10485760')),
+            backups=int(config.get('server', 'log-backups', fallback='3')),
+            block_timeout=float(config.get('server', 'log-block-timeout', fallback='0')))
     def str2bool(self, bool):
         if bool[0].lower() == 't': return True
         return False
 if __name__ == '__main__':
-    AuthServer().run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', nargs='?', type=int)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--cluster', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.workers > 1 and args.cluster is None:
+        config = configparser.RawConfigParser()
+        config.read('server.properties')
+        log_writer = AuthServer.open_log(config, config.get('server', 'log-file', fallback='logger.log'))
+        port = args.port or int(config.get('server', 'server-port'))
+        master = workers.Master(args.workers, [str(port)], abspath('.cluster-%d.sock' % port), lambda message: log_writer.write(log_writer.format('master | %s' % message)))
+        master.run()
+        log_writer.close()
+    else:
+        server = AuthServer(args.worker)
+        if args.port: server.s_port = args.port
+        server.run(args.worker, args.cluster)
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from bisect import bisect_left
+import json
+from twisted.web import resource
+class Counter(object):
+    __slots__ = ('labels', 'value')
+    def __init__(self, labels):
+        self.labels = labels
+        self.value = 0
+    def inc(self, amount=1): self.value += amount
+class Histogram(object):
+    __slots__ = ('labels', 'bounds', 'counts', 'sum', 'count')
+    def __init__(self, labels, bounds):
+        self.labels = labels
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+class Metric(object):
+    def __init__(self, name, kind, help, make):
+        self.name, self.kind, self.help, self.make = name, kind, help, make
+        self.children = {}
+    def get(self, labels):
+        key = tuple(sorted(labels.items()))
+        child = self.children.get(key)
+        if child is None: child = self.children[key] = self.make(key)
+        return child
+class Registry(object):
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+    def metric(self, name, kind, help, make):
+        metric = self.metrics.get(name)
+        if metric is None: metric = self.metrics[name] = Metric(name, kind, help, make)
+        elif metric.kind != kind: raise ValueError('Metric %s is already registered as a %s' % (name, metric.kind))
+        return metric
+    def counter(self, name, help='', **labels): return self.metric(name, 'counter', help, Counter).get(labels)
+    def histogram(self, name, help='', buckets=(), **labels):
+        bounds = tuple(sorted(buckets))
+        return self.metric(name, 'histogram', help, lambda key: Histogram(key, bounds)).get(labels)
+    def collector(self, name, kind, help, collect):
+        # collect() returns [(labels dict, value), ...] and is only called when the registry is read
+        self.collectors.append((name, kind, help, collect))
+    def samples(self):
+        for metric in self.metrics.values():
+            for child in metric.children.values():
+                labels = dict(child.labels)
+                if metric.kind == 'counter':
+                    yield metric.name, labels, child.value
+                    continue
+                total = 0
+                for bound, count in zip(child.bounds + (float('inf'),), child.counts):
+                    total += count
+                    yield metric.name + '_bucket', dict(labels, le=bound), total
+                yield metric.name + '_sum', labels, child.sum
+                yield metric.name + '_count', labels, child.count
+        for name, kind, help, collect in self.collectors:
+            for labels, value in collect(): yield name, labels, value
+    def render(self):
+        helps = dict((metric.name, (metric.kind, metric.help)) for metric in self.metrics.values())
+        helps.update((name, (kind, help)) for name, kind, help, collect in self.collectors)
+        lines, seen = [], set()
+        for name, labels, value in self.samples():
+            family = name
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.endswith(suffix) and name[:-len(suffix)] in helps and helps[name[:-len(suffix)]][0] == 'histogram': family = name[:-len(suffix)]
+            if family not in seen:
+                seen.add(family)
+                kind, help = helps[family]
+                if help: lines.append('# HELP %s %s' % (family, help))
+                lines.append('# TYPE %s %s' % (family, kind))
+            lines.append('%s%s %s' % (name, self.format_labels(labels), self.format_value(value)))
+        return '\n'.join(lines) + '\n'
+    @staticmethod
+    def format_labels(labels):
+        if not labels: return ''
+        return '{%s}' % ','.join('%s="%s"' % (key, Registry.format_value(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in sorted(labels.items()))
+    @staticmethod
+    def format_value(value):
+        if isinstance(value, str): return value
+        if value == float('inf'): return '+Inf'
+        if isinstance(value, float): return repr(value)
+        return str(value)
+class MetricsResource(resource.Resource):
+    isLeaf = True
+    def __init__(self, registry, connections=None):
+        resource.Resource.__init__(self)
+        self.registry = registry
+        self.connections = connections
+    def render_GET(self, request):
+        if request.path == b'/connections' and self.connections is not None:
+            request.setHeader(b'Content-Type', b'application/json')
+            return json.dumps(self.connections(), indent=1).encode('utf-8')
+        if request.path != b'/metrics':
+            request.setResponseCode(404)
+            return b'Not found\n'
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.registry.render().encode('utf-8')
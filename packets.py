@@ -1,30 +1,112 @@
-import csv
+import marshal
+import os
 import os.path
-def _load():
-    default_protocol_version = 0
+import struct
+import sys
+cache_format = 1
+csvpath = os.path.abspath(os.path.join(os.path.dirname(__file__), "packets.csv"))
+cachepath = os.path.join(os.path.dirname(csvpath), "__pycache__", "packets.%s.cache" % (sys.implementation.cache_tag or "none"))
+class PacketTable(object):
+    def __init__(self, protocol_version, minecraft_version, sections):
+        self.protocol_version = protocol_version
+        self.minecraft_version = minecraft_version
+        self.names = {}
+        self.idents = {}
+        for (protocol_mode, packet_direction), names in sections.items():
+            self.names[protocol_mode, packet_direction] = tuple(names)
+            for packet_ident, packet_name in enumerate(names):
+                self.idents[protocol_mode, packet_direction, packet_name] = packet_ident
+    def name(self, protocol_mode, packet_direction, packet_ident):
+        try: return self.names[protocol_mode, packet_direction][packet_ident]
+        except IndexError: raise KeyError((self.protocol_version, protocol_mode, packet_direction, packet_ident))
+    def ident(self, protocol_mode, packet_direction, packet_name): return self.idents[protocol_mode, packet_direction, packet_name]
+class PacketIndex(object):
+    def __init__(self, lookup): self.lookup = lookup
+    def __getitem__(self, key):
+        try: table = get_table(key[0])
+        except KeyError: raise KeyError(key)
+        return self.lookup(table, *key[1:])
+    def __contains__(self, key):
+        try: self[key]
+        except KeyError: return False
+        return True
+    def get(self, key, default=None):
+        try: return self[key]
+        except KeyError: return default
+def _parse(data):
+    import csv
     minecraft_versions = {}
-    packet_names = {}
-    packet_idents = {}
-    packet_ident = 0
-    last_section = None
-    csvpath = os.path.abspath(os.path.join(os.path.dirname(__file__), "packets.csv"))
-    with open(csvpath) as csvfile:
-        reader = csv.reader(csvfile)
-        for i, record in enumerate(reader):
-            if i == 0: continue
-            minecraft_version = record[0]
-            protocol_version = int(record[1])
-            protocol_mode = record[2]
-            packet_direction = record[3]
-            packet_name = record[4]
-            section = (protocol_version, protocol_mode, packet_direction)
-            if section != last_section: packet_ident = 0
-            last_section = section
-            default_protocol_version = max(default_protocol_version, protocol_version)
-            minecraft_versions[protocol_version] = minecraft_version
-            key = [protocol_version, protocol_mode, packet_direction]
-            packet_names [tuple(key + [packet_ident])] = packet_name
-            packet_idents[tuple(key + [packet_name ])] = packet_ident
-            packet_ident += 1
-    return default_protocol_version, minecraft_versions, packet_names, packet_idents
-default_protocol_version, minecraft_versions, packet_names, packet_idents = _load()
\ No newline at end of file
+    versions = {}
+    reader = csv.reader(data.decode("utf-8").splitlines())
+    for i, record in enumerate(reader):
+        if i == 0: continue
+        minecraft_version = record[0]
+        protocol_version = int(record[1])
+        protocol_mode = record[2]
+        packet_direction = record[3]
+        packet_name = record[4]
+        minecraft_versions[protocol_version] = minecraft_version
+        versions.setdefault(protocol_version, {}).setdefault((protocol_mode, packet_direction), []).append(packet_name)
+    return minecraft_versions, versions
+def _read_cache(stat):
+    try:
+        with open(cachepath, "rb") as cachefile: blob = cachefile.read()
+        header_length, = struct.unpack_from(">I", blob)
+        header = marshal.loads(blob[4:4 + header_length])
+    except (OSError, ValueError, EOFError, TypeError, struct.error): return None
+    if header[0] != cache_format: return None
+    body = blob[4 + header_length:]
+    if header[1:3] == (stat.st_mtime_ns, stat.st_size): return header, body
+    import hashlib
+    with open(csvpath, "rb") as csvfile: digest = hashlib.sha1(csvfile.read()).hexdigest()
+    if header[3] != digest: return None
+    header = (cache_format, stat.st_mtime_ns, stat.st_size) + header[3:]
+    _write_cache(header, body)
+    return header, body
+def _write_cache(header, body):
+    head = marshal.dumps(header)
+    tmppath = "%s.%d.tmp" % (cachepath, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cachepath), exist_ok=True)
+        with open(tmppath, "wb") as cachefile: cachefile.write(struct.pack(">I", len(head)) + head + body)
+        os.replace(tmppath, cachepath)
+    except OSError:
+        try: os.remove(tmppath)
+        except OSError: pass
+def _build(stat):
+    import hashlib
+    with open(csvpath, "rb") as csvfile: data = csvfile.read()
+    minecraft_versions, versions = _parse(data)
+    body, index = [], {}
+    offset = 0
+    for protocol_version, sections in versions.items():
+        blob = marshal.dumps({key: tuple(names) for key, names in sections.items()})
+        index[protocol_version] = (offset, len(blob))
+        body.append(blob)
+        offset += len(blob)
+    header = (cache_format, stat.st_mtime_ns, stat.st_size, hashlib.sha1(data).hexdigest(), max(versions), minecraft_versions, index)
+    _write_cache(header, b"".join(body))
+    return header, versions
+def _load():
+    global _cache_body, _cache_index
+    stat = os.stat(csvpath)
+    cached = _read_cache(stat)
+    if cached is None:
+        header, versions = _build(stat)
+        for protocol_version, sections in versions.items():
+            tables[protocol_version] = PacketTable(protocol_version, header[5][protocol_version], sections)
+    else: header, _cache_body = cached
+    _cache_index = header[6]
+    return header[4], header[5]
+def get_table(protocol_version):
+    table = tables.get(protocol_version)
+    if table is None:
+        offset, length = _cache_index[protocol_version]
+        sections = marshal.loads(_cache_body[offset:offset + length])
+        table = tables[protocol_version] = PacketTable(protocol_version, minecraft_versions[protocol_version], sections)
+    return table
+tables = {}
+_cache_body, _cache_index = b"", {}
+default_protocol_version, minecraft_versions = _load()
+packet_names = PacketIndex(PacketTable.name)
+packet_idents = PacketIndex(PacketTable.ident)
@@ -22,18 +22,26 @@ class Plugin(object):
         self.log = self.logger.info
         self.log("Initialized successfully...")
 
-    # Event wrapper
-    def event(self, event_name=None):
+    # Event wrapper; blocking handlers run on the plugin thread pool and may return a callable to run on the main thread
+    def event(self, event_name=None, blocking=False):
         def wrapper(method):
-            self.add_deferred_method(event_name, method)
+            self.add_deferred_method(event_name, method, blocking)
             return method
 
         return wrapper
 
-    def add_deferred_method(self, event_name, method):
+    # Packet decoder wrapper, called as method(player, buffer) with the buffer positioned after the packet ID
+    def packet(self, packet_name, mode="play"):
+        def wrapper(method):
+            self.deferred_events.append(lambda target: target.add_packet(mode, packet_name, method))
+            return method
+
+        return wrapper
+
+    def add_deferred_method(self, event_name, method, blocking=False):
         if event_name is None:
             event_name = method.__name__
-        self.deferred_events.append(lambda target: target.add_event(event_name, method))
+        self.deferred_events.append(lambda target: target.add_event(event_name, method, blocking))
 
     # Register event
     def register(self, plugin):
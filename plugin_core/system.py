@@ -6,8 +6,10 @@ import imp
 import os
 import sys
 import threading
+import time
 import traceback
 import types
+from concurrent.futures import ThreadPoolExecutor
 
 local_data = threading.local()
 
@@ -22,29 +24,134 @@ class PluginException(Exception): pass
 class EventError(PluginException): pass
 
 
+class EventHandler(object):
+    samples_size = 1024
+
+    def __init__(self, event, method, blocking=False):
+        self.event = event
+        self.method = method
+        self.blocking = blocking
+        self.name = "{0}.{1}".format(getattr(method, "__module__", None), getattr(method, "__qualname__", method))
+        self.count = 0
+        self.dropped = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+        self.warned = 0.0
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if len(self.samples) < self.samples_size:
+            self.samples.append(elapsed)
+        else:
+            self.samples[self.count % self.samples_size] = elapsed
+
+    @property
+    def p99(self):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
 class PluginSystem(object):
-    def __init__(self, folder=None):
+    def __init__(self, folder=None, slow_threshold=0.05, threads=4, max_pending=1000):
         self.events = {}
+        self.handlers = {}
+        self.packets = {}
         self.folder = folder
-
-    def add_event(self, name, method):
+        self.slow_threshold = slow_threshold
+        self.threads = threads
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor = None
+        # Called with a function and its arguments from a worker thread; runs it on the main thread
+        self.call_in_main = None
+        self.log = print
+
+    def add_event(self, name, method, blocking=False):
         if name in self.events:
             self.events[name].append(method)
         else:
             self.events[name] = [method]
+        self.handlers[name] = self.handlers.get(name, ()) + (EventHandler(name, method, blocking),)
+
+    def add_packet(self, mode, name, method):
+        self.packets.setdefault(mode, {}).setdefault(name, []).append(method)
+
+    def has_event(self, name):
+        return name in self.handlers
 
     def call_event(self, name, *args, **kwargs):
-        events_ = self.events.get(name)
-        if not events_:
-            pass
-            # raise EventError("Not found event named: {0}".format(name))
-        else:
-            for event_ in events_:
-                try:
-                    event_(*args, **kwargs)
-                except:
-                    print(traceback.print_exc())
+        handlers = self.handlers.get(name)
+        if handlers is None:
             return None
+        for handler in handlers:
+            if handler.blocking:
+                self._submit(handler, args, kwargs)
+                continue
+            start = time.perf_counter()
+            try:
+                handler.method(*args, **kwargs)
+            except:
+                traceback.print_exc()
+            self._finish(handler, time.perf_counter() - start)
+        return None
+
+    def _finish(self, handler, elapsed):
+        handler.record(elapsed)
+        if elapsed >= self.slow_threshold and time.monotonic() - handler.warned >= 10:
+            handler.warned = time.monotonic()
+            self.log("Slow plugin handler {0} for {1}: {2:.1f} ms (max {3:.1f} ms, p99 {4:.1f} ms over {5} calls)".format(
+                handler.name, handler.event, elapsed * 1000, handler.max * 1000, handler.p99 * 1000, handler.count))
+
+    def _submit(self, handler, args, kwargs):
+        if self.pending >= self.max_pending:
+            handler.dropped += 1
+            self.log("Plugin thread pool is full, dropped {0} for {1}".format(handler.name, handler.event))
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="plugin")
+        self.pending += 1
+        self.executor.submit(self._run_blocking, handler, args, kwargs)
+
+    def _run_blocking(self, handler, args, kwargs):
+        start = time.perf_counter()
+        result, error = None, None
+        try:
+            result = handler.method(*args, **kwargs)
+        except:
+            error = traceback.format_exc()
+        elapsed = time.perf_counter() - start
+        if self.call_in_main is None:
+            self._complete(handler, result, error, elapsed)
+        else:
+            self.call_in_main(self._complete, handler, result, error, elapsed)
+
+    def _complete(self, handler, result, error, elapsed):
+        self.pending -= 1
+        handler.record(elapsed)
+        if error is not None:
+            sys.stderr.write(error)
+        elif callable(result):
+            try:
+                result()
+            except:
+                traceback.print_exc()
+
+    def stats(self):
+        handlers = [handler for handlers in self.handlers.values() for handler in handlers]
+        return [{"event": handler.event, "handler": handler.name, "blocking": handler.blocking, "count": handler.count,
+                 "dropped": handler.dropped, "total": handler.total, "max": handler.max, "p99": handler.p99}
+                for handler in sorted(handlers, key=lambda handler: handler.total, reverse=True)]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
 
     def register_event(self, event):
         event.register(self)
@@ -1,5 +1,4 @@
 from plugin_core import Plugin
-import time
 plugin = Plugin(name="example", description="example plugin", version="")
 @plugin.event('player_join')
 def join(player):
@@ -8,8 +7,7 @@ def join(player):
 def command(player, command, args):
     if command == 'stop':
         plugin.log(player.username + ' has stopped server')
-        time.sleep( 1 )
-        player.stop()
+        player.tasks.add_delay(1, player.stop)
     if command == 'tp':
         if len(args) == 3:
             x, y, z = args[0], args[1], args[2]
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from twisted.internet import defer, protocol, reactor
+from twisted.internet.task import LoopingCall
+from twisted.protocols import basic
+import base64, json, os, socket, subprocess, sys
+def listen_reuseport(factory, port, host):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(511)
+    sock.setblocking(False)
+    listener = reactor.adoptStreamPort(sock.fileno(), family, factory)
+    sock.close()
+    return listener
+class ClusterLink(basic.LineOnlyReceiver):
+    delimiter = b'\n'
+    MAX_LENGTH = 16777216
+    def send(self, op, **kwargs):
+        kwargs['op'] = op
+        self.sendLine(json.dumps(kwargs).encode('utf-8'))
+    def lineReceived(self, line):
+        message = json.loads(line)
+        handler = getattr(self, 'on_' + message.pop('op'), None)
+        if handler is not None: handler(**message)
+class ClusterClient(ClusterLink):
+    def __init__(self, server): self.server = server
+    def connectionMade(self):
+        self.server.cluster = self
+        self.send('hello', worker=self.server.worker, names=[player.username for player in self.server.players])
+    def connectionLost(self, reason=None):
+        self.server.cluster = None
+        self.server.remote_players.clear()
+        if reactor.running and not self.server.stopping:
+            self.server.logging('Lost cluster hub, stopping worker')
+            self.server.shutdown()
+    def join(self, name): self.send('join', worker=self.server.worker, name=name)
+    def leave(self, name): self.send('leave', worker=self.server.worker, name=name)
+    def broadcast(self, name, data): self.send('broadcast', name=name, data=base64.b64encode(data).decode('ascii'))
+    def kick_all(self, message): self.send('kick_all', message=message)
+    def stop(self): self.send('stop')
+    def on_hello(self, worker, names): self.server.remote_players[worker] = list(names)
+    def on_join(self, worker, name): self.server.remote_players.setdefault(worker, []).append(name)
+    def on_leave(self, worker, name):
+        names = self.server.remote_players.get(worker, [])
+        if name in names: names.remove(name)
+    def on_gone(self, worker): self.server.remote_players.pop(worker, None)
+    def on_broadcast(self, name, data): self.server.broadcast(name, base64.b64decode(data), relay=False)
+    def on_kick_all(self, message): self.server.kick_all(message, relay=False)
+    def on_stop(self): self.server.shutdown()
+class ClusterClientFactory(protocol.ClientFactory):
+    def __init__(self, server): self.server = server
+    def buildProtocol(self, addr): return ClusterClient(self.server)
+    def clientConnectionFailed(self, connector, reason):
+        self.server.logging('Cannot reach cluster hub: %s' % reason.getErrorMessage())
+        self.server.shutdown()
+class Hub(ClusterLink):
+    worker = None
+    def __init__(self, master): self.master = master
+    def connectionLost(self, reason=None):
+        if self.worker is None: return
+        self.master.links.pop(self.worker, None)
+        self.master.names.pop(self.worker, None)
+        self.master.relay(self, 'gone', worker=self.worker)
+    def on_hello(self, worker, names):
+        self.worker = worker
+        self.master.links[worker] = self
+        self.master.names[worker] = list(names)
+        for other, other_names in self.master.names.items():
+            if other != worker: self.send('hello', worker=other, names=other_names)
+        self.master.relay(self, 'hello', worker=worker, names=names)
+    def on_join(self, worker, name):
+        self.master.names.setdefault(worker, []).append(name)
+        self.master.relay(self, 'join', worker=worker, name=name)
+    def on_leave(self, worker, name):
+        names = self.master.names.get(worker, [])
+        if name in names: names.remove(name)
+        self.master.relay(self, 'leave', worker=worker, name=name)
+    def on_broadcast(self, name, data): self.master.relay(self, 'broadcast', name=name, data=data)
+    def on_kick_all(self, message): self.master.relay(self, 'kick_all', message=message)
+    def on_stop(self): self.master.stop()
+class Master(protocol.Factory):
+    def __init__(self, workers, argv, path, log):
+        self.workers = workers
+        self.argv = argv
+        self.path = path
+        self.log = log
+        self.links = {}
+        self.names = {}
+        self.children = {}
+        self.stopping = False
+        self.stopped = defer.Deferred()
+        self.shutting_down = False
+    def buildProtocol(self, addr): return Hub(self)
+    def relay(self, sender, op, **kwargs):
+        for link in tuple(self.links.values()):
+            if link is not sender: link.send(op, **kwargs)
+    def spawn(self, worker):
+        self.children[worker] = subprocess.Popen([sys.executable, os.path.abspath(sys.argv[0])] + self.argv + ['--worker', str(worker), '--cluster', self.path])
+    def reap(self):
+        for worker, child in tuple(self.children.items()):
+            if child.poll() is None: continue
+            del self.children[worker]
+            if not self.stopping:
+                self.log('Worker %d exited with code %s, restarting' % (worker, child.returncode))
+                self.spawn(worker)
+        if self.stopping and not self.children and not self.stopped.called:
+            self.stopped.callback(None)
+            if not self.shutting_down: reactor.stop()
+    def stop(self):
+        if self.stopping: return
+        self.stopping = True
+        self.log('Stopping %d workers' % len(self.children))
+        for link in tuple(self.links.values()): link.send('stop')
+        reactor.callLater(10, self.terminate)
+    def terminate(self):
+        for child in self.children.values():
+            if child.poll() is None: child.kill()
+    def shutdown(self):
+        self.shutting_down = True
+        self.stop()
+        if not self.stopped.called: return self.stopped
+    def run(self):
+        if os.path.exists(self.path): os.remove(self.path)
+        listener = reactor.listenUNIX(self.path, self)
+        for worker in range(self.workers): self.spawn(worker)
+        LoopingCall(self.reap).start(0.5, now=False)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.shutdown)
+        self.log('Master started %d workers' % self.workers)
+        reactor.run()
+        listener.stopListening()
+        if os.path.exists(self.path): os.remove(self.path)